@@ -7,9 +7,23 @@ import sys
 from pathlib import Path
 from typing import IO
 
+from devtool.bench import ToolTiming, bench_tools, compare_to_baseline
 from devtool.diff import ChangedPackage, ChangeType, diff_software
-from devtool.markdown import print_packages_table
+from devtool.executables import executable_name
+from devtool.image_report import ImageReport, diff_reports, image_report, resolve_image_ref
+from devtool.image_versions import read_image_versions, verify_versions
+from devtool.layer_plan import binary_sizes, count_version_changes, plan_layers, tool_stats
+from devtool.markdown import format_size, print_markdown_table, print_packages_table
+from devtool.prefetch import prefetch_plan, verify_prefetch
 from devtool.renovate import renovate_json
+from devtool.rpm_lock import (
+    find_lockfiles,
+    parse_requested_packages,
+    parse_rpms_lock,
+    read_file_at_ref,
+)
+from devtool.rpm_sizes import SizeTable, diff_sizes, download_sizes, total_sizes
+from devtool.sbom import cyclonedx_document, purl_key, sbom_components, sbom_purls
 from devtool.software_list import Package, list_go_tools, list_packages
 from devtool.version import Version
 
@@ -62,6 +76,148 @@ def make_parser() -> argparse.ArgumentParser:
     )
     prep_release_parser.set_defaults(__cmd__=prepare_release)
 
+    bench_parser = subcommands.add_parser(
+        "bench-tools", help="Measure the startup latency of the tools in the built image"
+    )
+    bench_parser.description = (
+        "Runs the version command of each tool N times inside the built image. "
+        "Reports the min/median/p95 startup latency and the binary size of each tool "
+        "and optionally compares them against a baseline (the --outfile of a previous run)."
+    )
+    bench_parser.add_argument("--image", default="localhost/task-runner:latest")
+    bench_parser.add_argument("-n", "--runs", type=int, default=10)
+    bench_parser.add_argument("--outfile", type=Path, help="Write the results as JSON")
+    bench_parser.add_argument("--baseline", type=Path, help="Compare against this JSON file")
+    bench_parser.add_argument(
+        "--max-slowdown",
+        type=float,
+        default=1.5,
+        help="Flag tools whose median latency grew by more than this ratio (default: %(default)s)",
+    )
+    bench_parser.add_argument(
+        "--max-growth",
+        type=float,
+        default=1.25,
+        help="Flag tools whose binary size grew by more than this ratio (default: %(default)s)",
+    )
+    bench_parser.set_defaults(__cmd__=bench)
+
+    image_report_parser = subcommands.add_parser(
+        "image-report", help="Report how much each package contributes to the image size"
+    )
+    image_report_parser.description = (
+        "Exports the image with podman and attributes the bytes in each layer to packages "
+        "(RPMs, pip distributions and the tools in /usr/local/bin)."
+    )
+    image_report_parser.add_argument("--image", default="localhost/task-runner:latest")
+    image_report_parser.add_argument(
+        "--base-image",
+        help="Compare against this image or release version (e.g. v1.2.0)",
+    )
+    image_report_parser.add_argument(
+        "--top", type=int, default=30, help="Show only the N largest packages (default: 30)"
+    )
+    image_report_parser.set_defaults(__cmd__=report_image)
+
+    layer_plan_parser = subcommands.add_parser(
+        "layer-plan", help="Plan the layers for Go binaries based on how often they change"
+    )
+    layer_plan_parser.description = (
+        "Uses the history of Installed-Software.md to determine how often each Go binary "
+        "gets updated and groups the binaries into layers so that a typical update "
+        "invalidates as few bytes as possible. Prints COPY instructions for the Containerfile."
+    )
+    layer_plan_parser.add_argument(
+        "--image",
+        default="localhost/task-runner:latest",
+        help="Get the binary sizes from this image (default: %(default)s)",
+    )
+    layer_plan_parser.add_argument("--max-layers", type=int, default=4)
+    layer_plan_parser.add_argument(
+        "--since", help="Only consider history since this date (git log --since syntax)"
+    )
+    layer_plan_parser.set_defaults(__cmd__=plan_go_layers)
+
+    rpm_sizes_parser = subcommands.add_parser(
+        "rpm-sizes", help="Report the download sizes of locked RPMs"
+    )
+    rpm_sizes_parser.description = (
+        "Computes the download size of each requested RPM (together with the other RPMs "
+        "built from the same source RPM) per arch, based on the rpms.lock.yaml files."
+    )
+    rpm_sizes_parser.add_argument(
+        "--lockfile",
+        dest="lockfiles",
+        type=Path,
+        action="append",
+        help="Path to an rpms.lock.yaml file, relative to the repo root (default: all of them)",
+    )
+    rpm_sizes_parser.add_argument("--base-ref", help="Show the size changes since this ref")
+    rpm_sizes_parser.add_argument("--head-ref")
+    rpm_sizes_parser.set_defaults(__cmd__=rpm_sizes)
+
+    prefetch_plan_parser = subcommands.add_parser(
+        "prefetch-plan", help="Plan a checksum-deduplicated download of all locked RPMs"
+    )
+    prefetch_plan_parser.description = (
+        "Reads all the rpms.lock.yaml files and outputs a JSON download plan where each "
+        "unique checksum gets downloaded only once. Each download lists the {arch}/{filename} "
+        "destinations (relative to the prefetch directory) it should be hard-linked to."
+    )
+    prefetch_plan_parser.add_argument("--outfile", type=Path)
+    prefetch_plan_parser.set_defaults(__cmd__=plan_prefetch)
+
+    verify_prefetch_parser = subcommands.add_parser(
+        "verify-prefetch", help="Verify a directory of prefetched RPMs against the lockfiles"
+    )
+    verify_prefetch_parser.description = (
+        "Checks that the directory contains exactly the locked RPMs, with the expected sizes "
+        "and checksums, in the {arch}/{filename} layout used by prefetch-plan."
+    )
+    verify_prefetch_parser.add_argument("prefetch_dir", type=Path)
+    verify_prefetch_parser.add_argument(
+        "--lockfile",
+        dest="lockfiles",
+        type=Path,
+        action="append",
+        help="Path to an rpms.lock.yaml file, relative to the repo root (default: all of them)",
+    )
+    verify_prefetch_parser.add_argument(
+        "--fail-fast",
+        action="store_true",
+        help="Don't compute checksums if any file is missing or has the wrong size",
+    )
+    verify_prefetch_parser.set_defaults(__cmd__=verify_prefetched_rpms)
+
+    sbom_parser = subcommands.add_parser(
+        "sbom", help="Generate a CycloneDX SBOM of the image from the lockfiles"
+    )
+    sbom_parser.description = (
+        "Generates a CycloneDX SBOM from the RPM lockfile, the go.mod files, the pip "
+        "requirements.txt and the local tools, without building or scanning the image."
+    )
+    sbom_parser.add_argument("--arch", default="x86_64")
+    sbom_parser.add_argument("--outfile", type=Path)
+    sbom_parser.add_argument(
+        "--compare",
+        type=Path,
+        metavar="SBOM",
+        help="Instead of printing the SBOM, report how much of this (e.g. syft-generated) "
+        "CycloneDX or SPDX JSON SBOM it covers",
+    )
+    sbom_parser.set_defaults(__cmd__=generate_sbom)
+
+    verify_versions_parser = subcommands.add_parser(
+        "verify-versions", help="Verify the versions of the software installed in the image"
+    )
+    verify_versions_parser.description = (
+        "Exports the image filesystem and checks the versions of all the installed software "
+        "against the expected versions, without executing anything. Reads the embedded build "
+        "info of Go binaries, the rpmdb, the pip dist-info directories and the local tools."
+    )
+    verify_versions_parser.add_argument("--image", default="localhost/task-runner:latest")
+    verify_versions_parser.set_defaults(__cmd__=verify_image_versions)
+
     return parser
 
 
@@ -142,6 +298,255 @@ def prepare_release(base_ref: str | None) -> int:
     return 0
 
 
+def bench(
+    image: str,
+    runs: int,
+    outfile: Path | None,
+    baseline: Path | None,
+    max_slowdown: float,
+    max_growth: float,
+) -> int:
+    repo_root = _repo_root()
+    packages = list_packages(repo_root)
+    packages.sort(key=lambda p: p.name)
+
+    try:
+        timings = bench_tools(image, packages, runs)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    print_markdown_table(
+        {
+            "Name": [t.name for t in timings],
+            "Size": [str(t.size) for t in timings],
+            "Min (ms)": [f"{t.min_ms:.2f}" for t in timings],
+            "Median (ms)": [f"{t.median_ms:.2f}" for t in timings],
+            "p95 (ms)": [f"{t.p95_ms:.2f}" for t in timings],
+        },
+        sys.stdout,
+    )
+
+    if outfile:
+        with outfile.open("w") as f:
+            json.dump([t.asdict() for t in timings], f, indent=2)
+            f.write("\n")
+
+    if baseline:
+        baseline_timings = [ToolTiming(**t) for t in json.loads(baseline.read_text())]
+        regressions = compare_to_baseline(timings, baseline_timings, max_slowdown, max_growth)
+        if regressions:
+            print()
+            print(f"=== Regressions compared to {baseline} ===")
+            for regression in regressions:
+                print(
+                    f"{regression.name} {regression.what}: "
+                    f"{regression.old_value} => {regression.new_value}"
+                )
+            return 1
+
+    return 0
+
+
+def report_image(image: str, base_image: str | None, top: int) -> None:
+    repo_root = _repo_root()
+    packages = list_packages(repo_root)
+
+    report = image_report(image, packages)
+    _print_image_report(report, top)
+
+    if base_image:
+        base_image = resolve_image_ref(base_image)
+        base_report = image_report(base_image, packages)
+
+        changes = diff_reports(base_report, report)
+        total_delta = report.total_size() - base_report.total_size()
+
+        print()
+        print(f"=== Changes compared to {base_image} ({format_size(total_delta, signed=True)}) ===")
+        print()
+        if changes:
+            print_markdown_table(
+                {
+                    "Package": [c.name for c in changes],
+                    "Before": [format_size(c.old_size) for c in changes],
+                    "After": [format_size(c.new_size) for c in changes],
+                    "Change": [format_size(c.delta, signed=True) for c in changes],
+                },
+                sys.stdout,
+            )
+        else:
+            print("No changes")
+
+
+def plan_go_layers(image: str, max_layers: int, since: str | None) -> int:
+    repo_root = _repo_root()
+    go_packages = [
+        p for p in list_packages(repo_root) if p.type in ("go-tool", "go-submodule")
+    ]
+
+    changes, n_updates = count_version_changes(repo_root, [p.name for p in go_packages], since)
+    if n_updates == 0:
+        print("No updates of Go binaries found in the history", file=sys.stderr)
+        return 1
+
+    sizes = binary_sizes(image, [executable_name(p) for p in go_packages])
+    tools = tool_stats(go_packages, sizes, changes, n_updates)
+    plan = plan_layers(tools, max_layers)
+    single_layer = plan_layers(tools, 1)
+
+    print(f"=== Go binary updates in the last {n_updates} updates ===")
+    print()
+    tools.sort(key=lambda t: t.update_frequency, reverse=True)
+    print_markdown_table(
+        {
+            "Name": [t.name for t in tools],
+            "Updates": [str(changes[t.name]) for t in tools],
+            "Size": [format_size(t.size) for t in tools],
+        },
+        sys.stdout,
+    )
+    print()
+    print(
+        "Expected bytes re-pulled per update: "
+        f"{format_size(int(single_layer.expected_repull()))} (single layer) => "
+        f"{format_size(int(plan.expected_repull()))} ({len(plan.layers)} layers)"
+    )
+    print()
+    print(plan.copy_stanzas())
+    return 0
+
+
+def rpm_sizes(lockfiles: list[Path] | None, base_ref: str | None, head_ref: str | None) -> None:
+    repo_root = _repo_root()
+
+    def sizes_at_ref(lockfile: Path, ref: str | None) -> SizeTable:
+        try:
+            rpms = parse_rpms_lock(read_file_at_ref(repo_root, lockfile, ref))
+            requested = parse_requested_packages(
+                read_file_at_ref(repo_root, lockfile.with_name("rpms.in.yaml"), ref)
+            )
+        except subprocess.CalledProcessError:
+            # The lockfile doesn't exist at this ref
+            return {}
+        return download_sizes(rpms, requested)
+
+    for i, lockfile in enumerate(lockfiles or find_lockfiles(repo_root)):
+        if i > 0:
+            print()
+
+        sizes = sizes_at_ref(lockfile, head_ref)
+        if not base_ref:
+            print(f"=== {lockfile} ===")
+            print()
+            _print_size_table(sizes)
+            continue
+
+        changes = diff_sizes(sizes_at_ref(lockfile, base_ref), sizes)
+        print(f"=== {lockfile} (changes since {base_ref}) ===")
+        print()
+        if changes:
+            _print_size_table(changes, signed=True)
+        else:
+            print("No changes")
+
+
+def plan_prefetch(outfile: Path | None) -> None:
+    repo_root = _repo_root()
+    rpms = [
+        rpm
+        for lockfile in find_lockfiles(repo_root)
+        for rpm in parse_rpms_lock(repo_root.joinpath(lockfile).read_text())
+    ]
+    plan = prefetch_plan(rpms)
+
+    if outfile:
+        with outfile.open("w") as f:
+            json.dump(plan.asdict(), f, indent=2)
+            f.write("\n")
+    else:
+        print(json.dumps(plan.asdict(), indent=2))
+
+    saved = plan.naive_size - plan.download_size
+    print(
+        f"{len(plan.downloads)} downloads ({format_size(plan.download_size)}) "
+        f"for {len(rpms)} locked RPMs ({format_size(plan.naive_size)}), "
+        f"saved {format_size(saved)}",
+        file=sys.stderr,
+    )
+
+
+def verify_prefetched_rpms(
+    prefetch_dir: Path, lockfiles: list[Path] | None, fail_fast: bool
+) -> int:
+    repo_root = _repo_root()
+    rpms = [
+        rpm
+        for lockfile in lockfiles or find_lockfiles(repo_root)
+        for rpm in parse_rpms_lock(repo_root.joinpath(lockfile).read_text())
+    ]
+    results = verify_prefetch(prefetch_dir, rpms, fail_fast=fail_fast)
+
+    rv = 0
+    for arch, result in results.items():
+        for problem, filenames in [
+            ("missing", result.missing),
+            ("extra", result.extra),
+            ("corrupt", result.corrupt),
+        ]:
+            for filename in filenames:
+                print(f"{arch}: {problem}: {filename}")
+        if not result.ok():
+            rv = 1
+
+    if rv == 0:
+        print(f"All {len(rpms)} locked RPMs verified", file=sys.stderr)
+    return rv
+
+
+def generate_sbom(arch: str, outfile: Path | None, compare: Path | None) -> None:
+    repo_root = _repo_root()
+    components = sbom_components(repo_root, arch)
+
+    if compare:
+        ours = {purl_key(component["purl"]) for component in components}
+        theirs = {purl_key(purl) for purl in sbom_purls(json.loads(compare.read_text()))}
+        covered = ours & theirs
+
+        print(f"=== Components in {compare} not found in the lockfile-based SBOM ===")
+        for key in sorted(theirs - ours):
+            print(key)
+        print()
+        print(f"Coverage: {len(covered)}/{len(theirs)} ({len(covered) / max(len(theirs), 1):.1%})")
+        print(f"Components not found in {compare}: {len(ours - theirs)}")
+        return
+
+    version = repo_root.joinpath("VERSION").read_text().strip()
+    document = cyclonedx_document(components, version)
+
+    if outfile:
+        with outfile.open("w") as f:
+            json.dump(document, f, indent=2)
+            f.write("\n")
+    else:
+        print(json.dumps(document, indent=2))
+
+
+def verify_image_versions(image: str) -> int:
+    repo_root = _repo_root()
+    packages = list_packages(repo_root)
+
+    mismatches = verify_versions(packages, read_image_versions(image))
+    for mismatch in mismatches:
+        print(f"{mismatch.name}: expected {mismatch.expected}, found {mismatch.found}")
+
+    if mismatches:
+        return 1
+
+    print(f"All {len(packages)} packages have the expected versions", file=sys.stderr)
+    return 0
+
+
 def _repo_root() -> Path:
     proc = subprocess.run(
         ["git", "rev-parse", "--show-toplevel"], stdout=subprocess.PIPE, text=True, check=True
@@ -186,6 +591,58 @@ def _print_packages(format: str, packages: list[Package], outfile: IO[str]) -> N
             raise RuntimeError(f"Invalid format passed from CLI: {format}")
 
 
+def _print_image_report(report: ImageReport, top: int) -> None:
+    print(f"=== Layers of {report.image} ({format_size(report.total_size())}) ===")
+    print()
+    print_markdown_table(
+        {
+            "#": [str(i) for i in range(len(report.layers))],
+            "Size": [format_size(layer.size) for layer in report.layers],
+            "Largest packages": [
+                ", ".join(name for name, _ in layer.package_sizes.most_common(3))
+                for layer in report.layers
+            ],
+            "Created by": [layer.created_by[:80] for layer in report.layers],
+        },
+        sys.stdout,
+    )
+
+    largest = report.package_sizes().most_common(top)
+    print()
+    print(f"=== Largest packages in {report.image} ===")
+    print()
+    print_markdown_table(
+        {
+            "Package": [name for name, _ in largest],
+            "Type": [report.owner_types.get(name, "-") for name, _ in largest],
+            "Size": [format_size(size) for _, size in largest],
+            "Layers": [
+                ", ".join(
+                    str(i) for i, layer in enumerate(report.layers) if layer.package_sizes[name]
+                )
+                for name, _ in largest
+            ],
+        },
+        sys.stdout,
+    )
+
+
+def _print_size_table(sizes: SizeTable, signed: bool = False) -> None:
+    totals = total_sizes(sizes)
+    rows = sizes
+    if not signed:
+        rows = dict(sorted(sizes.items(), key=lambda item: sum(item[1].values()), reverse=True))
+
+    columns = {"Package": [*rows, "Total"]}
+    for arch, total in sorted(totals.items()):
+        columns[arch] = [
+            format_size(arch_sizes.get(arch, 0), signed=signed) for arch_sizes in rows.values()
+        ]
+        columns[arch].append(format_size(total, signed=signed))
+
+    print_markdown_table(columns, sys.stdout)
+
+
 def _print_changes(changes: list[ChangedPackage], changelog_format: bool = False) -> None:
     # Print in reverse order by importance (most important changes first)
     for pkg in sorted(changes, key=lambda pkg: pkg.what_changed(), reverse=True):
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import math
+import shlex
+import statistics
+import subprocess
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from typing import Any, NamedTuple
+
+from devtool.executables import version_command
+from devtool.software_list import Package
+
+
+@dataclass(frozen=True)
+class ToolTiming:
+    name: str
+    executable: str
+    size: int
+    min_ms: float
+    median_ms: float
+    p95_ms: float
+
+    def asdict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+class Regression(NamedTuple):
+    name: str
+    what: str
+    old_value: float
+    new_value: float
+
+
+def bench_tools(image: str, packages: list[Package], runs: int) -> list[ToolTiming]:
+    """Measure the startup latency of each package's version command inside the image.
+
+    All the measurements happen in a single container, so the container startup overhead
+    doesn't skew the results. Raises ValueError if any of the tools is missing or if any
+    version command fails, the latency of a failing command doesn't mean anything.
+    """
+    version_commands = {
+        package.name: cmd for package in packages if (cmd := version_command(package))
+    }
+
+    script_lines = []
+    for name, cmd in version_commands.items():
+        script_lines.append(
+            # Fails if command -v doesn't find an executable file (prints nothing or a builtin)
+            f"path=$(command -v {shlex.quote(cmd[0])})\n"
+            f"if ! size=$(stat -L -c %s \"$path\" 2>/dev/null); then\n"
+            f"    echo {shlex.quote(name)} missing\n"
+            f"else\n"
+            f"    for _ in $(seq {runs}); do\n"
+            f"        start=$(date +%s%N)\n"
+            f"        {shlex.join(cmd)} >/dev/null 2>&1\n"
+            f"        status=$?\n"
+            f"        end=$(date +%s%N)\n"
+            f"        echo {shlex.quote(name)} \"$size\" $((end - start)) \"$status\"\n"
+            f"    done\n"
+            f"fi\n"
+        )
+
+    proc = subprocess.run(
+        ["podman", "run", "--rm", image, "bash", "-c", "".join(script_lines)],
+        stdout=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+
+    sizes: dict[str, int] = {}
+    durations_ms: defaultdict[str, list[float]] = defaultdict(list)
+    errors: dict[str, str] = {}
+    for line in proc.stdout.splitlines():
+        match line.split():
+            case [name, "missing"]:
+                errors[name] = f"{version_commands[name][0]}: executable not found"
+            case [name, size, duration_ns, status]:
+                if status != "0":
+                    errors[name] = f"{shlex.join(version_commands[name])}: exit code {status}"
+                sizes[name] = int(size)
+                durations_ms[name].append(int(duration_ns) / 1_000_000)
+            case _:
+                raise ValueError(f"Unexpected line in the benchmark output: {line!r}")
+
+    if errors:
+        raise ValueError(
+            f"Failed to benchmark {len(errors)} tools in {image}:\n" + "\n".join(errors.values())
+        )
+
+    return [
+        ToolTiming(
+            name=name,
+            executable=version_commands[name][0],
+            size=sizes[name],
+            min_ms=round(min(durations), 2),
+            median_ms=round(statistics.median(durations), 2),
+            p95_ms=round(_percentile(durations, 95), 2),
+        )
+        for name, durations in durations_ms.items()
+    ]
+
+
+def compare_to_baseline(
+    timings: list[ToolTiming],
+    baseline: list[ToolTiming],
+    max_slowdown: float,
+    max_growth: float,
+) -> list[Regression]:
+    """Find tools whose median latency or binary size grew by more than the allowed ratio."""
+    baseline_by_name = {timing.name: timing for timing in baseline}
+    regressions: list[Regression] = []
+
+    for timing in timings:
+        old = baseline_by_name.get(timing.name)
+        if old is None:
+            continue
+
+        # Ignore differences within a few milliseconds, those are just noise
+        slower = timing.median_ms > old.median_ms * max_slowdown
+        if slower and timing.median_ms - old.median_ms > 5:
+            regressions.append(
+                Regression(timing.name, "median_ms", old.median_ms, timing.median_ms)
+            )
+
+        if timing.size > old.size * max_growth:
+            regressions.append(Regression(timing.name, "size", old.size, timing.size))
+
+    return regressions
+
+
+def _percentile(values: list[float], percent: int) -> float:
+    """Get the percentile of the values using the nearest-rank method."""
+    ordered = sorted(values)
+    rank = math.ceil(percent / 100 * len(ordered))
+    return ordered[max(rank, 1) - 1]
@@ -0,0 +1,34 @@
+from devtool.software_list import Package
+
+PACKAGE_NAME_TO_EXECUTABLE_NAME = {
+    "coreutils-single": "coreutils",
+    "git-core": "git",
+    "findutils": "find",
+    "gawk": "awk",
+    "gettext-envsubst": "envsubst",
+    "awscli": "aws",
+}
+
+# overrides for tools that don't support a simple --version flag
+VERSION_ARG_OVERRIDES = {
+    "tkn": ["version", "--component", "client"],
+    "cosign": ["version"],
+    "oras": ["version"],
+    "kubectl": ["version", "--client"],
+    "oc": ["version", "--client"],
+}
+
+# tools that don't have a version flag at all
+NO_VERSION_ARG = {"microdnf"}
+
+
+def executable_name(package: Package) -> str:
+    return PACKAGE_NAME_TO_EXECUTABLE_NAME.get(package.name, package.name)
+
+
+def version_command(package: Package) -> list[str] | None:
+    """Get the command that prints the version of the package (None if there isn't one)."""
+    executable = executable_name(package)
+    if executable in NO_VERSION_ARG:
+        return None
+    return [executable, *VERSION_ARG_OVERRIDES.get(executable, ["--version"])]
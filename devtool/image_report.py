@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+import json
+import posixpath
+import re
+import subprocess
+import tarfile
+import tempfile
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, NamedTuple
+
+from devtool.executables import executable_name
+from devtool.software_list import Package
+from devtool.version import Version
+
+RELEASED_IMAGE_REPO = "quay.io/konflux-ci/task-runner"
+
+UNOWNED = "(unowned)"
+
+
+@dataclass(frozen=True)
+class Layer:
+    digest: str
+    created_by: str
+    size: int
+    package_sizes: Counter[str] = field(default_factory=Counter)
+
+
+@dataclass(frozen=True)
+class ImageReport:
+    image: str
+    layers: list[Layer]
+    # {owner_name: owner_type}, e.g. {"skopeo": "rpm", "gpgme": "rpm (dependency)"}
+    owner_types: dict[str, str]
+
+    def package_sizes(self) -> Counter[str]:
+        total: Counter[str] = Counter()
+        for layer in self.layers:
+            total.update(layer.package_sizes)
+        return total
+
+    def total_size(self) -> int:
+        return sum(layer.size for layer in self.layers)
+
+
+class SizeChange(NamedTuple):
+    name: str
+    old_size: int
+    new_size: int
+
+    @property
+    def delta(self) -> int:
+        return self.new_size - self.old_size
+
+
+def resolve_image_ref(image_or_version: str) -> str:
+    """Turn a release version (e.g. v1.2.0) into the released image, keep other refs as is."""
+    try:
+        Version.parse(image_or_version.removeprefix("v"))
+    except ValueError:
+        return image_or_version
+    return f"{RELEASED_IMAGE_REPO}:{image_or_version.removeprefix('v')}"
+
+
+def image_report(image: str, packages: list[Package]) -> ImageReport:
+    """Attribute the bytes in each layer of the image to the packages that own them.
+
+    Files are attributed to RPMs based on the rpmdb, to pip distributions based on
+    the RECORD files in site-packages and to the rest of the known packages based on
+    their executables in /usr/local/bin.
+    """
+    _ensure_image_exists(image)
+
+    known_types = {package.name: package.type for package in packages}
+    owners, owner_types = _rpm_file_owners(image, known_types)
+
+    for package in packages:
+        if package.type in ("go-tool", "go-submodule", "local"):
+            owners[f"/usr/local/bin/{executable_name(package)}"] = package.name
+            owner_types[package.name] = package.type
+
+    with tempfile.TemporaryDirectory(prefix="image-report.") as tmpdir:
+        layout_dir = Path(tmpdir) / "image"
+        subprocess.run(
+            ["podman", "save", "--format=oci-dir", "--output", layout_dir, image],
+            check=True,
+        )
+        layer_blobs, history = _read_oci_layout(layout_dir)
+
+        for blob in layer_blobs:
+            pip_owners = _pip_file_owners(blob)
+            for name in set(pip_owners.values()):
+                owner_types.setdefault(name, known_types.get(name, "pip (dependency)"))
+            owners.update(pip_owners)
+
+        layers = [
+            Layer(
+                digest=blob.name,
+                created_by=created_by,
+                size=blob.stat().st_size,
+                package_sizes=_attribute_layer(blob, owners),
+            )
+            for blob, created_by in zip(layer_blobs, history)
+        ]
+
+    owner_types[UNOWNED] = "-"
+    return ImageReport(image=image, layers=layers, owner_types=owner_types)
+
+
+def diff_reports(base: ImageReport, head: ImageReport) -> list[SizeChange]:
+    """Get the packages whose size changed, biggest changes first."""
+    base_sizes = base.package_sizes()
+    head_sizes = head.package_sizes()
+
+    changes = [
+        SizeChange(name, base_sizes[name], head_sizes[name])
+        for name in base_sizes.keys() | head_sizes.keys()
+        if base_sizes[name] != head_sizes[name]
+    ]
+    changes.sort(key=lambda change: abs(change.delta), reverse=True)
+    return changes
+
+
+def _ensure_image_exists(image: str) -> None:
+    proc = subprocess.run(["podman", "image", "exists", image])
+    if proc.returncode != 0:
+        subprocess.run(["podman", "pull", image], check=True)
+
+
+def _rpm_file_owners(
+    image: str, known_types: dict[str, str]
+) -> tuple[dict[str, str], dict[str, str]]:
+    proc = subprocess.run(
+        [
+            "podman",
+            "run",
+            "--rm",
+            image,
+            "rpm",
+            "--query",
+            "--all",
+            "--queryformat",
+            r"[%{NAME}\t%{FILENAMES}\n]",
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    owners: dict[str, str] = {}
+    owner_types: dict[str, str] = {}
+
+    for line in proc.stdout.splitlines():
+        name, _, path = line.partition("\t")
+        # Directories can be owned by multiple packages, the first one wins
+        owners.setdefault(path, name)
+        owner_types[name] = known_types.get(name, "rpm (dependency)")
+
+    return owners, owner_types
+
+
+def _read_oci_layout(layout_dir: Path) -> tuple[list[Path], list[str]]:
+    def read_blob(digest: str) -> Any:
+        algorithm, _, hexdigest = digest.partition(":")
+        return json.loads(layout_dir.joinpath("blobs", algorithm, hexdigest).read_text())
+
+    index = json.loads(layout_dir.joinpath("index.json").read_text())
+    manifest = read_blob(index["manifests"][0]["digest"])
+    config = read_blob(manifest["config"]["digest"])
+
+    layer_blobs = [
+        layout_dir.joinpath("blobs", *layer["digest"].split(":", 1))
+        for layer in manifest["layers"]
+    ]
+    history = [
+        entry.get("created_by", "")
+        for entry in config.get("history", [])
+        if not entry.get("empty_layer", False)
+    ]
+    # Some images (e.g. squashed ones) don't have accurate history
+    if len(history) != len(layer_blobs):
+        history = [""] * len(layer_blobs)
+
+    return layer_blobs, history
+
+
+def _pip_file_owners(layer_blob: Path) -> dict[str, str]:
+    owners: dict[str, str] = {}
+    dist_info_re = re.compile(r"(?P<site_packages>.*)/(?P<dist>[^/]+?)-[^/-]+\.dist-info/RECORD")
+
+    with tarfile.open(layer_blob) as tar:
+        for member in tar:
+            match = dist_info_re.fullmatch(_normalize_path(member.name))
+            if not match or not (f := tar.extractfile(member)):
+                continue
+
+            dist_name = match.group("dist").lower().replace("_", "-")
+            for line in f.read().decode().splitlines():
+                relpath, _, _ = line.partition(",")
+                path = posixpath.normpath(posixpath.join(match.group("site_packages"), relpath))
+                owners[path] = dist_name
+
+    return owners
+
+
+def _attribute_layer(layer_blob: Path, owners: dict[str, str]) -> Counter[str]:
+    package_sizes: Counter[str] = Counter()
+
+    with tarfile.open(layer_blob) as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            package_sizes[_find_owner(_normalize_path(member.name), owners)] += member.size
+
+    return package_sizes
+
+
+def _find_owner(path: str, owners: dict[str, str]) -> str:
+    if owner := owners.get(path):
+        return owner
+
+    # Bytecode compiled after installation (e.g. foo/__pycache__/bar.cpython-312.opt-1.pyc)
+    # is not recorded anywhere, attribute it to the owner of the source file
+    pycache_dir, _, filename = path.rpartition("/")
+    if pycache_dir.endswith("/__pycache__") and filename.endswith(".pyc"):
+        module_name = filename.split(".", 1)[0]
+        source = f"{pycache_dir.removesuffix('/__pycache__')}/{module_name}.py"
+        return owners.get(source, UNOWNED)
+
+    return UNOWNED
+
+
+def _normalize_path(tar_path: str) -> str:
+    return posixpath.normpath("/" + tar_path)
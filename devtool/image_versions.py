@@ -0,0 +1,267 @@
+from __future__ import annotations
+
+import re
+import shlex
+import sqlite3
+import struct
+import subprocess
+import tarfile
+import tempfile
+from contextlib import closing
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import NamedTuple
+
+from devtool.executables import executable_name
+from devtool.software_list import LOCAL_TOOL_VERSION_RE, Package
+
+GO_BUILDINFO_MAGIC = b"\xff Go buildinf:"
+
+_RPM_TAG_NAME = 1000
+_RPM_TAG_VERSION = 1001
+_RPM_TAG_RELEASE = 1002
+_RPM_TYPE_STRING = 6
+
+# RHEL 10 keeps the rpmdb in /usr/lib/sysimage/rpm, /var/lib/rpm is a symlink to it
+# (older bases have the files in /var/lib/rpm)
+_RPMDB_DIRS = ("usr/lib/sysimage/rpm/", "var/lib/rpm/")
+
+_DIST_INFO_RE = re.compile(r"site-packages/(?P<name>[^/]+?)-(?P<version>[^/-]+)\.dist-info(/|$)")
+
+
+@dataclass(frozen=True)
+class GoBuildInfo:
+    go_version: str
+    # The module that contains the main package, e.g. github.com/anchore/syft
+    module_path: str
+    # The version of that module, e.g. v1.41.1 (or "(devel)")
+    module_version: str
+    settings: dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class ImageVersions:
+    """Versions of the installed software, as recorded in the image filesystem."""
+
+    # {executable: build info} for Go binaries in /usr/local/bin
+    go_binaries: dict[str, GoBuildInfo] = field(default_factory=dict)
+    # {executable: version} for the local tools (scripts) in /usr/local/bin
+    scripts: dict[str, str] = field(default_factory=dict)
+    # {name: version-release} from the rpmdb
+    rpms: dict[str, str] = field(default_factory=dict)
+    # {name: version} from the dist-info directories in site-packages
+    pip_packages: dict[str, str] = field(default_factory=dict)
+
+
+class VersionMismatch(NamedTuple):
+    name: str
+    expected: str
+    found: str | None
+
+
+def read_image_versions(image: str) -> ImageVersions:
+    """Read the versions of all the installed software in one pass over the image filesystem.
+
+    Doesn't execute anything in the image. Go binaries get identified by their embedded
+    build info, RPMs by the headers in the rpmdb.
+    """
+    versions = ImageVersions()
+
+    container_id = subprocess.run(
+        ["podman", "create", image], stdout=subprocess.PIPE, text=True, check=True
+    ).stdout.strip()
+
+    try:
+        with tempfile.TemporaryDirectory(prefix="image-versions.") as tmpdir:
+            export = subprocess.Popen(["podman", "export", container_id], stdout=subprocess.PIPE)
+            assert export.stdout is not None
+
+            with tarfile.open(fileobj=export.stdout, mode="r|") as tar:
+                for member in tar:
+                    path = member.name.removeprefix("./")
+
+                    if match := _DIST_INFO_RE.search(path):
+                        name = re.sub(r"[-_.]+", "-", match.group("name")).lower()
+                        versions.pip_packages[name] = match.group("version")
+
+                    if not member.isfile() or not (f := tar.extractfile(member)):
+                        continue
+
+                    if path.startswith("usr/local/bin/"):
+                        executable = path.removeprefix("usr/local/bin/")
+                        content = f.read()
+                        if buildinfo := parse_go_buildinfo(content):
+                            versions.go_binaries[executable] = buildinfo
+                        elif match := LOCAL_TOOL_VERSION_RE.search(content.decode("latin-1")):
+                            versions.scripts[executable] = match.group(1)
+                    elif path.startswith(_RPMDB_DIRS) and Path(path).name.startswith(
+                        "rpmdb.sqlite"
+                    ):
+                        # Also extracts the -wal and -shm files, if any
+                        Path(tmpdir, Path(path).name).write_bytes(f.read())
+
+            if export.wait() != 0:
+                raise subprocess.CalledProcessError(export.returncode, export.args)
+
+            rpmdb = Path(tmpdir, "rpmdb.sqlite")
+            if not rpmdb.exists():
+                raise ValueError(
+                    f"No rpmdb.sqlite found in {image} (looked in {', '.join(_RPMDB_DIRS)})"
+                )
+            versions.rpms = read_rpmdb_sqlite(rpmdb)
+    finally:
+        subprocess.run(["podman", "rm", container_id], stdout=subprocess.DEVNULL, check=True)
+
+    return versions
+
+
+def verify_versions(packages: list[Package], versions: ImageVersions) -> list[VersionMismatch]:
+    mismatches: list[VersionMismatch] = []
+
+    for package in packages:
+        found: str | None
+        match package.type:
+            case "rpm":
+                found = versions.rpms.get(package.name)
+                ok = found == package.version
+            case "pip":
+                found = versions.pip_packages.get(package.name)
+                ok = found == package.version
+            case "local":
+                found = versions.scripts.get(executable_name(package))
+                ok = found == package.version
+            case "go-tool":
+                buildinfo = versions.go_binaries.get(executable_name(package))
+                found = buildinfo and f"{buildinfo.module_path}@{buildinfo.module_version}"
+                ok = found == f"{package.module_path}@v{package.version}"
+            case "go-submodule":
+                # Built from a local checkout, the module version is usually (devel). The
+                # real version gets injected with -ldflags -X, look for it in the values.
+                buildinfo = versions.go_binaries.get(executable_name(package))
+                if buildinfo is None:
+                    found = None
+                    ok = False
+                elif "-ldflags" in buildinfo.settings:
+                    found = buildinfo.settings["-ldflags"]
+                    ok = any(
+                        value.removeprefix("v") == package.version
+                        for value in _ldflags_variables(found).values()
+                    )
+                elif buildinfo.module_version not in ("", "(devel)"):
+                    found = buildinfo.module_version
+                    ok = found.removeprefix("v") == package.version
+                else:
+                    raise ValueError(
+                        f"Can't verify the version of {package.name}: the Go build info of "
+                        f"{executable_name(package)} has no -ldflags and no module version"
+                    )
+            case _:
+                raise ValueError(f"Unknown package type: {package.type}")
+
+        if not ok:
+            mismatches.append(VersionMismatch(package.name, package.version, found or None))
+
+    return mismatches
+
+
+def parse_go_buildinfo(data: bytes) -> GoBuildInfo | None:
+    """Parse the build info that the Go linker embeds in binaries (Go 1.18+ format).
+
+    See https://pkg.go.dev/debug/buildinfo. Returns None for non-Go files.
+    """
+    start = data.find(GO_BUILDINFO_MAGIC)
+    while start >= 0:
+        # The header is 32 bytes: magic (14), pointer size (1), flags (1), padding (16).
+        # Flag 0x2 means the version strings are inlined right after the header.
+        flags = data[start + 15] if start + 15 < len(data) else 0
+        if start % 16 == 0 and flags & 0x2:
+            go_version, pos = _read_varint_bytes(data, start + 32)
+            modinfo, _ = _read_varint_bytes(data, pos)
+            return _parse_modinfo(go_version.decode(), modinfo)
+        start = data.find(GO_BUILDINFO_MAGIC, start + 1)
+
+    return None
+
+
+def read_rpmdb_sqlite(rpmdb: Path) -> dict[str, str]:
+    """Read {name: version-release} for all the packages in an sqlite rpmdb."""
+    rpms: dict[str, str] = {}
+
+    with closing(sqlite3.connect(f"file:{rpmdb}?mode=ro", uri=True)) as conn:
+        for (blob,) in conn.execute("SELECT blob FROM Packages"):
+            tags = _parse_rpm_header_strings(blob)
+            name = tags.get(_RPM_TAG_NAME)
+            if name:
+                rpms[name] = f"{tags.get(_RPM_TAG_VERSION)}-{tags.get(_RPM_TAG_RELEASE)}"
+
+    return rpms
+
+
+def _ldflags_variables(ldflags: str) -> dict[str, str]:
+    """Get the variables that the -X flags (-X name=value or -X=name=value) set."""
+    variables: dict[str, str] = {}
+    args = iter(shlex.split(ldflags))
+    for arg in args:
+        if arg == "-X" or arg == "--X":
+            arg = next(args, "")
+        elif arg.startswith(("-X=", "--X=")):
+            arg = arg.partition("=")[2]
+        else:
+            continue
+
+        name, sep, value = arg.partition("=")
+        if sep:
+            variables[name] = value
+
+    return variables
+
+
+def _read_varint_bytes(data: bytes, pos: int) -> tuple[bytes, int]:
+    length = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        length |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            break
+    return data[pos : pos + length], pos + length
+
+
+def _parse_modinfo(go_version: str, modinfo_bytes: bytes) -> GoBuildInfo:
+    # The module info is wrapped in 16-byte sentinels
+    if len(modinfo_bytes) >= 32:
+        modinfo_bytes = modinfo_bytes[16:-16]
+    modinfo = modinfo_bytes.decode(errors="replace")
+
+    module_path = ""
+    module_version = ""
+    settings: dict[str, str] = {}
+
+    for line in modinfo.splitlines():
+        kind, _, rest = line.partition("\t")
+        match kind:
+            case "mod":
+                module_path, _, rest = rest.partition("\t")
+                module_version, _, _ = rest.partition("\t")
+            case "build":
+                key, _, value = rest.partition("=")
+                settings[key] = value.strip('"')
+
+    return GoBuildInfo(go_version, module_path, module_version, settings)
+
+
+def _parse_rpm_header_strings(blob: bytes) -> dict[int, str]:
+    """Parse the STRING tags from an RPM header blob (as stored in the rpmdb)."""
+    index_count, _ = struct.unpack_from(">II", blob, 0)
+    data_start = 8 + 16 * index_count
+    tags: dict[int, str] = {}
+
+    for i in range(index_count):
+        tag, tag_type, offset, _ = struct.unpack_from(">IIII", blob, 8 + 16 * i)
+        if tag_type == _RPM_TYPE_STRING:
+            end = blob.index(b"\0", data_start + offset)
+            tags[tag] = blob[data_start + offset : end].decode(errors="replace")
+
+    return tags
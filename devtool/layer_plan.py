@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import math
+import subprocess
+from dataclasses import dataclass
+from pathlib import Path
+
+from devtool.executables import executable_name
+from devtool.markdown import parse_package_table
+from devtool.software_list import Package
+
+GO_BIN_DIR = "/deps/golang/bin"
+
+
+@dataclass(frozen=True)
+class ToolStats:
+    name: str
+    executable: str
+    size: int
+    # The fraction of past updates that changed the version of this tool
+    update_frequency: float
+
+
+@dataclass(frozen=True)
+class LayerPlan:
+    layers: list[list[ToolStats]]
+
+    def expected_repull(self) -> float:
+        """The expected number of bytes clients have to re-pull per update."""
+        return sum(_layer_cost(layer) for layer in self.layers)
+
+    def copy_stanzas(self) -> str:
+        stanzas: list[str] = []
+        for layer in self.layers:
+            names = ", ".join(tool.name for tool in layer)
+            frequency = _change_probability(layer)
+            sources = " ".join(f"{GO_BIN_DIR}/{tool.executable}" for tool in layer)
+            stanzas.append(
+                f"# Changes in ~{frequency:.0%} of updates: {names}\n"
+                f"COPY --from=go-build {sources} /usr/local/bin/"
+            )
+        return "\n".join(stanzas)
+
+
+def count_version_changes(
+    repo_root: Path, names: list[str], since: str | None
+) -> tuple[dict[str, int], int]:
+    """Count how many times each package changed in the history of Installed-Software.md.
+
+    Returns the per-package counts and the total number of updates that changed any of
+    the packages.
+    """
+    cmd = ["git", "log", "--format=%H", "--reverse"]
+    if since:
+        cmd.append(f"--since={since}")
+    cmd.extend(["--", "Installed-Software.md"])
+
+    commits = subprocess.run(
+        cmd, stdout=subprocess.PIPE, text=True, check=True, cwd=repo_root
+    ).stdout.split()
+
+    changes = dict.fromkeys(names, 0)
+    n_updates = 0
+    previous: dict[str, str] | None = None
+
+    for commit in commits:
+        content = subprocess.run(
+            ["git", "show", f"{commit}:Installed-Software.md"],
+            stdout=subprocess.PIPE,
+            text=True,
+            check=True,
+            cwd=repo_root,
+        ).stdout
+        versions = parse_package_table(content)
+
+        if previous is not None:
+            changed = [
+                name for name in names if name in previous and previous[name] != versions.get(name)
+            ]
+            for name in changed:
+                changes[name] += 1
+            if changed:
+                n_updates += 1
+
+        previous = versions
+
+    return changes, n_updates
+
+
+def tool_stats(
+    packages: list[Package], sizes: dict[str, int], changes: dict[str, int], n_updates: int
+) -> list[ToolStats]:
+    return [
+        ToolStats(
+            name=package.name,
+            executable=executable_name(package),
+            size=sizes[executable_name(package)],
+            # Tools that never changed still might, don't assume they never will
+            update_frequency=max(changes.get(package.name, 0), 0.5) / max(n_updates, 1),
+        )
+        for package in packages
+    ]
+
+
+def binary_sizes(image: str, executables: list[str]) -> dict[str, int]:
+    proc = subprocess.run(
+        [
+            "podman",
+            "run",
+            "--rm",
+            "--workdir=/usr/local/bin",
+            image,
+            "stat",
+            "--dereference",
+            "--format=%n %s",
+            *executables,
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    sizes: dict[str, int] = {}
+    for line in proc.stdout.splitlines():
+        name, size = line.split()
+        sizes[name] = int(size)
+    return sizes
+
+
+def plan_layers(tools: list[ToolStats], max_layers: int) -> LayerPlan:
+    """Group tools into at most max_layers layers, minimizing the expected re-pulled bytes.
+
+    Sorts the tools by update frequency and finds the optimal split of the sorted list
+    into contiguous groups (rarely updated tools end up together, frequently updated
+    tools, especially large ones, get their own layers).
+    """
+    tools = sorted(tools, key=lambda tool: (tool.update_frequency, tool.size))
+    n = len(tools)
+    max_layers = max(1, min(max_layers, n))
+
+    # best[k][i] = (cost, split points) of grouping the first i tools into k layers
+    best: list[list[tuple[float, list[int]]]] = [
+        [(math.inf, [])] * (n + 1) for _ in range(max_layers + 1)
+    ]
+    best[0][0] = (0.0, [])
+
+    for k in range(1, max_layers + 1):
+        for i in range(1, n + 1):
+            for j in range(k - 1, i):
+                prev_cost, prev_splits = best[k - 1][j]
+                cost = prev_cost + _layer_cost(tools[j:i])
+                if cost < best[k][i][0]:
+                    best[k][i] = (cost, prev_splits + [j])
+
+    _, splits = min((best[k][n] for k in range(1, max_layers + 1)), key=lambda b: b[0])
+    bounds = splits + [n]
+    return LayerPlan([tools[start:end] for start, end in zip(bounds, bounds[1:])])
+
+
+def _change_probability(layer: list[ToolStats]) -> float:
+    """The probability that an update changes at least one tool in the layer."""
+    return 1 - math.prod(1 - min(tool.update_frequency, 1) for tool in layer)
+
+
+def _layer_cost(layer: list[ToolStats]) -> float:
+    return _change_probability(layer) * sum(tool.size for tool in layer)
@@ -81,3 +81,24 @@ def print_markdown_table(
             outfile.write(value.ljust(column_width))
             outfile.write(" ")
         outfile.write("|\n")
+
+
+def format_size(size: int, signed: bool = False) -> str:
+    """Format a size in bytes as a human-readable string, e.g. 1.5 MiB."""
+    sign = ""
+    if signed:
+        sign = "-" if size < 0 else "+"
+    elif size < 0:
+        sign = "-"
+
+    value = float(abs(size))
+    for unit in ("B", "KiB", "MiB"):
+        if value < 1024:
+            break
+        value /= 1024
+    else:
+        unit = "GiB"
+
+    if unit == "B":
+        return f"{sign}{int(value)} B"
+    return f"{sign}{value:.1f} {unit}"
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import hashlib
+import mmap
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+
+from devtool.rpm_lock import LockedRPM
+
+
+@dataclass
+class Download:
+    url: str
+    checksum: str
+    size: int
+    # Paths relative to the prefetch directory, in the form {arch}/{filename}.
+    # Download the file once, then hard-link (or copy) it to the other destinations.
+    destinations: list[str] = field(default_factory=list)
+
+    def asdict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass(frozen=True)
+class PrefetchPlan:
+    downloads: list[Download]
+    # The number of bytes to download without deduplication
+    naive_size: int
+
+    @property
+    def download_size(self) -> int:
+        return sum(download.size for download in self.downloads)
+
+    def asdict(self) -> dict[str, Any]:
+        return {
+            "naive_size": self.naive_size,
+            "download_size": self.download_size,
+            "downloads": [download.asdict() for download in self.downloads],
+        }
+
+
+def prefetch_destination(rpm: LockedRPM) -> str:
+    return f"{rpm.arch}/{rpm.filename}"
+
+
+def prefetch_plan(rpms: list[LockedRPM]) -> PrefetchPlan:
+    """Plan the download of the RPMs, downloading each unique checksum only once.
+
+    Noarch RPMs appear in the lockfile once for every arch, and the same RPMs often
+    appear in more than one lockfile. All of them have the same checksum.
+    """
+    downloads: dict[str, Download] = {}
+    checksum_by_destination: dict[str, str] = {}
+
+    for rpm in rpms:
+        destination = prefetch_destination(rpm)
+        if checksum_by_destination.setdefault(destination, rpm.checksum) != rpm.checksum:
+            raise ValueError(
+                f"Conflicting checksums for {destination}: "
+                f"{checksum_by_destination[destination]} != {rpm.checksum}"
+            )
+
+        download = downloads.setdefault(
+            rpm.checksum, Download(url=rpm.url, checksum=rpm.checksum, size=rpm.size)
+        )
+        if destination not in download.destinations:
+            download.destinations.append(destination)
+
+    return PrefetchPlan(
+        downloads=sorted(downloads.values(), key=lambda download: download.destinations[0]),
+        naive_size=sum(rpm.size for rpm in rpms),
+    )
+
+
+@dataclass(frozen=True)
+class ArchVerification:
+    missing: list[str] = field(default_factory=list)
+    extra: list[str] = field(default_factory=list)
+    corrupt: list[str] = field(default_factory=list)
+
+    def ok(self) -> bool:
+        return not (self.missing or self.extra or self.corrupt)
+
+
+def verify_prefetch(
+    prefetch_dir: Path, rpms: list[LockedRPM], fail_fast: bool = False
+) -> dict[str, ArchVerification]:
+    """Verify that the prefetch directory contains exactly the locked RPMs.
+
+    Expects the {arch}/{filename} layout (see prefetch_plan). Checks the sizes of all
+    the files first, which is cheap, and then hashes the files with the correct size
+    in parallel. With fail_fast, skips the hashing if any file is missing or has the
+    wrong size.
+    """
+    results: defaultdict[str, ArchVerification] = defaultdict(ArchVerification)
+    expected = {prefetch_destination(rpm): rpm for rpm in rpms}
+
+    for arch in {rpm.arch for rpm in rpms}:
+        arch_dir = prefetch_dir / arch
+        if not arch_dir.is_dir():
+            continue
+        for path in arch_dir.iterdir():
+            if f"{arch}/{path.name}" not in expected:
+                results[arch].extra.append(path.name)
+
+    to_hash: list[tuple[Path, LockedRPM]] = []
+    for destination, rpm in expected.items():
+        path = prefetch_dir / destination
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            results[rpm.arch].missing.append(rpm.filename)
+            continue
+
+        if size != rpm.size:
+            results[rpm.arch].corrupt.append(rpm.filename)
+        else:
+            to_hash.append((path, rpm))
+
+    if fail_fast and any(not result.ok() for result in results.values()):
+        return _sorted_results(results)
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        checksums = executor.map(lambda item: _file_checksum(item[0], item[1].checksum), to_hash)
+        for (_, rpm), checksum in zip(to_hash, checksums):
+            if checksum != rpm.checksum:
+                results[rpm.arch].corrupt.append(rpm.filename)
+
+    return _sorted_results(results)
+
+
+def _file_checksum(path: Path, expected_checksum: str) -> str:
+    """Compute the checksum of the file using the same algorithm as the expected checksum."""
+    algorithm, _, _ = expected_checksum.partition(":")
+    digest = hashlib.new(algorithm)
+
+    with path.open("rb") as f:
+        if os.fstat(f.fileno()).st_size > 0:
+            # hashlib releases the GIL while hashing large buffers, so memory-mapping
+            # the whole file lets the threads hash files truly in parallel
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                digest.update(m)
+
+    return f"{algorithm}:{digest.hexdigest()}"
+
+
+def _sorted_results(results: dict[str, ArchVerification]) -> dict[str, ArchVerification]:
+    for result in results.values():
+        result.missing.sort()
+        result.extra.sort()
+        result.corrupt.sort()
+    return dict(sorted(results.items()))
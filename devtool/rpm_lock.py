@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import subprocess
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, NotRequired, TypedDict
+
+import yaml
+
+
+@dataclass(frozen=True)
+class LockedRPM:
+    """An RPM as resolved in an rpms.lock.yaml file (for one arch)."""
+
+    name: str
+    evr: str
+    arch: str
+    url: str
+    size: int
+    checksum: str
+    sourcerpm: str
+
+    @property
+    def filename(self) -> str:
+        return self.url.rpartition("/")[2]
+
+    def asdict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+class _RpmsIn(TypedDict):
+    packages: NotRequired[list[str]]
+    reinstallPackages: NotRequired[list[str]]
+    updatePackages: NotRequired[list[str]]
+    arches: list[str]
+
+
+class _RpmsLock(TypedDict):
+    arches: list[_RpmsLockArch]
+
+
+class _RpmsLockArch(TypedDict):
+    arch: str
+    packages: list[_RpmsLockPackage]
+
+
+class _RpmsLockPackage(TypedDict):
+    url: str
+    size: int
+    checksum: str
+    name: str
+    evr: str
+    sourcerpm: str
+
+
+def find_lockfiles(repo_root: Path) -> list[Path]:
+    """Find all the rpms.lock.yaml files in the repo (relative to the repo root)."""
+    return sorted(
+        path.relative_to(repo_root)
+        for path in repo_root.joinpath("deps").rglob("rpms.lock.yaml")
+    )
+
+
+def parse_rpms_lock(content: str) -> list[LockedRPM]:
+    rpms_lock: _RpmsLock = yaml.safe_load(content)
+    return [
+        LockedRPM(
+            name=package["name"],
+            evr=package["evr"],
+            arch=arch["arch"],
+            url=package["url"],
+            size=package["size"],
+            checksum=package["checksum"],
+            sourcerpm=package["sourcerpm"],
+        )
+        for arch in rpms_lock["arches"]
+        for package in arch["packages"]
+    ]
+
+
+def parse_requested_packages(content: str) -> list[str]:
+    """Get the names of the packages requested in an rpms.in.yaml file."""
+    rpms_in: _RpmsIn = yaml.safe_load(content)
+    return (
+        rpms_in.get("packages", [])
+        + rpms_in.get("reinstallPackages", [])
+        + rpms_in.get("updatePackages", [])
+    )
+
+
+def read_file_at_ref(repo_root: Path, filepath: Path, ref: str | None) -> str:
+    """Read the file from the specified git ref (or from the working tree if ref is None)."""
+    if ref is None:
+        return repo_root.joinpath(filepath).read_text()
+
+    proc = subprocess.run(
+        ["git", "show", f"{ref}:{filepath.as_posix()}"],
+        stdout=subprocess.PIPE,
+        text=True,
+        check=True,
+        cwd=repo_root,
+    )
+    return proc.stdout
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from collections import defaultdict
+
+from devtool.rpm_lock import LockedRPM
+
+OTHER_DEPENDENCIES = "(other dependencies)"
+
+# {group_name: {arch: download_size}}
+type SizeTable = dict[str, dict[str, int]]
+
+
+def download_sizes(rpms: list[LockedRPM], requested: list[str]) -> SizeTable:
+    """Compute the download size of each requested package per arch.
+
+    Each requested package is grouped together with all the other locked RPMs built
+    from the same source RPM (e.g. python3 with python3-libs). The lockfile doesn't
+    record which package pulled in which dependency, so the remaining RPMs are
+    accounted for as a single group.
+    """
+    group_by_sourcerpm: dict[str, str] = {}
+    for rpm in rpms:
+        if rpm.name in requested:
+            # Requested packages from the same source RPM end up in the first one's group
+            group_by_sourcerpm.setdefault(rpm.sourcerpm, rpm.name)
+
+    sizes: SizeTable = defaultdict(lambda: defaultdict(int))
+    for rpm in rpms:
+        group = group_by_sourcerpm.get(rpm.sourcerpm, OTHER_DEPENDENCIES)
+        sizes[group][rpm.arch] += rpm.size
+
+    return {group: dict(arch_sizes) for group, arch_sizes in sizes.items()}
+
+
+def total_sizes(sizes: SizeTable) -> dict[str, int]:
+    totals: dict[str, int] = defaultdict(int)
+    for arch_sizes in sizes.values():
+        for arch, size in arch_sizes.items():
+            totals[arch] += size
+    return dict(totals)
+
+
+def diff_sizes(old: SizeTable, new: SizeTable) -> SizeTable:
+    """Get the per-arch size changes of groups that changed, biggest changes first."""
+    changes: SizeTable = {}
+    for group in old.keys() | new.keys():
+        old_sizes = old.get(group, {})
+        new_sizes = new.get(group, {})
+        deltas = {
+            arch: new_sizes.get(arch, 0) - old_sizes.get(arch, 0)
+            for arch in sorted(old_sizes.keys() | new_sizes.keys())
+        }
+        if any(deltas.values()):
+            changes[group] = deltas
+
+    return dict(
+        sorted(changes.items(), key=lambda item: max(map(abs, item[1].values())), reverse=True)
+    )
@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import re
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+from urllib.parse import unquote
+
+from devtool.rpm_lock import parse_rpms_lock
+from devtool.software_list import list_go_submodules, list_local_tools, read_go_mod
+
+type Component = dict[str, Any]
+
+
+def sbom_components(project_root: Path, arch: str) -> list[Component]:
+    """List the SBOM components of the image for the arch, based only on the lockfiles.
+
+    Go modules are all the modules required in the go.mod files of the tools, which is
+    a superset of the modules that actually get compiled into the binaries.
+    """
+    components: dict[str, Component] = {}
+    for component in (
+        _rpm_components(project_root, arch)
+        + _go_components(project_root)
+        + _pip_components(project_root)
+        + _local_components(project_root)
+    ):
+        components.setdefault(component["bom-ref"], component)
+
+    return sorted(components.values(), key=lambda component: component["bom-ref"])
+
+
+def cyclonedx_document(components: list[Component], image_version: str) -> dict[str, Any]:
+    return {
+        "bomFormat": "CycloneDX",
+        "specVersion": "1.5",
+        "serialNumber": f"urn:uuid:{uuid.uuid4()}",
+        "version": 1,
+        "metadata": {
+            "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "tools": {"components": [{"type": "application", "name": "devtool"}]},
+            "component": {
+                "type": "container",
+                "name": "task-runner",
+                "version": image_version,
+            },
+        },
+        "components": components,
+    }
+
+
+def sbom_purls(document: dict[str, Any]) -> set[str]:
+    """Get all the purls from a CycloneDX or SPDX (JSON) document."""
+    purls: set[str] = set()
+
+    if document.get("bomFormat") == "CycloneDX":
+
+        def collect(components: list[Component]) -> None:
+            for component in components:
+                if purl := component.get("purl"):
+                    purls.add(purl)
+                collect(component.get("components", []))
+
+        collect(document.get("components", []))
+    elif "spdxVersion" in document:
+        for package in document.get("packages", []):
+            for ref in package.get("externalRefs", []):
+                if ref.get("referenceType") == "purl":
+                    purls.add(ref["referenceLocator"])
+    else:
+        raise ValueError("Unknown SBOM format, expected CycloneDX or SPDX JSON")
+
+    return purls
+
+
+def purl_key(purl: str) -> str:
+    """Normalize a purl for comparison between SBOMs produced by different tools.
+
+    Drops qualifiers and subpath, the namespace of RPMs (the vendor, which tools often
+    disagree about) and normalizes the names of Python packages.
+    """
+    purl = unquote(purl.split("?", 1)[0].split("#", 1)[0])
+    purl_type, _, rest = purl.removeprefix("pkg:").partition("/")
+    purl_type = purl_type.lower()
+    name, _, version = rest.rpartition("@")
+
+    match purl_type:
+        case "rpm":
+            name = name.rpartition("/")[2]
+        case "pypi":
+            name = re.sub(r"[-_.]+", "-", name).lower()
+
+    return f"pkg:{purl_type}/{name}@{version}"
+
+
+def _rpm_components(project_root: Path, arch: str) -> list[Component]:
+    rpms_lock = project_root / "deps" / "rpm" / "rpms.lock.yaml"
+    components: list[Component] = []
+
+    for rpm in parse_rpms_lock(rpms_lock.read_text()):
+        if rpm.arch != arch:
+            continue
+
+        epoch, _, version = rpm.evr.rpartition(":")
+        # The lockfile arch is the target arch, noarch RPMs only have it in the filename
+        rpm_arch = rpm.filename.removesuffix(".rpm").rpartition(".")[2]
+        qualifiers = f"arch={rpm_arch}"
+        if epoch:
+            qualifiers += f"&epoch={epoch}"
+
+        algorithm, _, digest = rpm.checksum.partition(":")
+        components.append(
+            _component(
+                "library",
+                rpm.name,
+                version,
+                f"pkg:rpm/redhat/{rpm.name}@{version}?{qualifiers}",
+                hashes=[_hash(algorithm, digest)],
+            )
+        )
+
+    return components
+
+
+def _go_components(project_root: Path) -> list[Component]:
+    components: list[Component] = []
+
+    for tool_dir in sorted(project_root.joinpath("deps/go-tools").iterdir()):
+        if not tool_dir.is_dir():
+            continue
+        for module in read_go_mod(tool_dir)["Require"]:
+            components.append(
+                _component(
+                    "library",
+                    module["Path"],
+                    module["Version"],
+                    f"pkg:golang/{module['Path']}@{module['Version']}",
+                )
+            )
+
+    for package in list_go_submodules(project_root):
+        go_mod = project_root / package.module_path / "go.mod"
+        module_match = None
+        if go_mod.exists():
+            module_match = re.search(r"^module\s+(\S+)", go_mod.read_text(), re.MULTILINE)
+
+        if module_match:
+            purl = f"pkg:golang/{module_match.group(1)}@v{package.version}"
+        else:
+            purl = f"pkg:generic/{package.name}@{package.version}"
+        components.append(_component("application", package.name, package.version, purl))
+
+    return components
+
+
+def _pip_components(project_root: Path) -> list[Component]:
+    requirements_txt = project_root / "deps" / "pip" / "requirements.txt"
+    if not requirements_txt.exists():
+        return []
+
+    components: list[Component] = []
+    # Join the continuation lines, each requirement then takes up a single line
+    content = requirements_txt.read_text().replace("\\\n", " ")
+
+    for line in content.splitlines():
+        line = line.split("#", 1)[0].strip()
+        if "==" not in line:
+            continue
+
+        requirement, *options = line.split()
+        name, _, version = requirement.partition("==")
+        name = re.sub(r"[-_.]+", "-", name).lower()
+        hashes = [
+            _hash(*option.removeprefix("--hash=").split(":", 1))
+            for option in options
+            if option.startswith("--hash=")
+        ]
+        components.append(
+            _component("library", name, version, f"pkg:pypi/{name}@{version}", hashes=hashes)
+        )
+
+    return components
+
+
+def _local_components(project_root: Path) -> list[Component]:
+    return [
+        _component(
+            "application", tool.name, tool.version, f"pkg:generic/{tool.name}@{tool.version}"
+        )
+        for tool in list_local_tools(project_root)
+    ]
+
+
+def _component(
+    component_type: str,
+    name: str,
+    version: str,
+    purl: str,
+    hashes: list[dict[str, str]] | None = None,
+) -> Component:
+    component: Component = {
+        "type": component_type,
+        "bom-ref": purl,
+        "name": name,
+        "version": version,
+        "purl": purl,
+    }
+    if hashes:
+        component["hashes"] = hashes
+    return component
+
+
+def _hash(algorithm: str, digest: str) -> dict[str, str]:
+    # sha256 => SHA-256
+    cyclonedx_alg = re.sub(r"^([a-z]+)(\d+)$", r"\1-\2", algorithm).upper()
+    return {"alg": cyclonedx_alg, "content": digest}
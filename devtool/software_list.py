@@ -5,9 +5,9 @@ import re
 import subprocess
 from dataclasses import asdict, dataclass
 from pathlib import Path
-from typing import Any, Iterable, Literal, NotRequired, TypedDict
+from typing import Any, Iterable, Literal, TypedDict
 
-import yaml
+from devtool.rpm_lock import parse_requested_packages, parse_rpms_lock
 
 
 @dataclass(frozen=True)
@@ -54,6 +54,8 @@ class PipPackage:
 
 type Package = GoPackage | RPMPackage | LocalPackage | PipPackage
 
+LOCAL_TOOL_VERSION_RE = re.compile(r"^VERSION=['\"]?(\d+\.\d+(\.\d+)?)['\"]?", re.MULTILINE)
+
 
 def list_packages(project_root: Path) -> list[Package]:
     return (
@@ -87,14 +89,18 @@ def list_go_tools(project_root: Path) -> list[GoPackage]:
     return packages
 
 
-def _list_go_tools(tool_dir: Path) -> Iterable[GoPackage]:
+def read_go_mod(module_dir: Path) -> _GoMod:
     proc = subprocess.run(
         ["go", "mod", "edit", "-json"],
         stdout=subprocess.PIPE,
         check=True,
-        cwd=tool_dir,
+        cwd=module_dir,
     )
-    go_mod: _GoMod = json.loads(proc.stdout)
+    return json.loads(proc.stdout)
+
+
+def _list_go_tools(tool_dir: Path) -> Iterable[GoPackage]:
+    go_mod = read_go_mod(tool_dir)
 
     def find_parent_module(package_path: str) -> _GoModModule | None:
         for module in go_mod["Require"]:
@@ -209,39 +215,17 @@ def _fetch_remote_tags(submodule_path: Path) -> list[str]:
     return matching_tags
 
 
-class _RpmsIn(TypedDict):
-    packages: NotRequired[list[str]]
-    reinstallPackages: NotRequired[list[str]]
-    updatePackages: NotRequired[list[str]]
-    arches: list[str]
-
-
-class _RpmsLock(TypedDict):
-    arches: list[_RpmsLockArch]
-
-
-class _RpmsLockArch(TypedDict):
-    arch: str
-    packages: list[_RpmsLockPackage]
-
-
-class _RpmsLockPackage(TypedDict):
-    name: str
-    evr: str
-
-
 def list_rpms(project_root: Path) -> list[RPMPackage]:
     rpms_dir = project_root / "deps" / "rpm"
 
-    rpms_in: _RpmsIn = yaml.safe_load((rpms_dir / "rpms.in.yaml").read_text())
-    rpms_lock: _RpmsLock = yaml.safe_load((rpms_dir / "rpms.lock.yaml").read_text())
+    package_names = parse_requested_packages((rpms_dir / "rpms.in.yaml").read_text())
+    locked_rpms = parse_rpms_lock((rpms_dir / "rpms.lock.yaml").read_text())
+
+    evrs_by_arch: dict[str, dict[str, str]] = {}
+    for rpm in locked_rpms:
+        evrs_by_arch.setdefault(rpm.arch, {}).setdefault(rpm.name, rpm.evr)
 
     packages: list[RPMPackage] = []
-    package_names = (
-        rpms_in.get("packages", [])
-        + rpms_in.get("reinstallPackages", [])
-        + rpms_in.get("updatePackages", [])
-    )
 
     for package_name in package_names:
         if package_name.startswith("containers-common"):
@@ -249,15 +233,7 @@ def list_rpms(project_root: Path) -> list[RPMPackage]:
             # for skopeo/podman/buildah, not real packages
             continue
 
-        evrs: dict[str, str | None] = {}
-        for arch in rpms_lock["arches"]:
-            try:
-                resolved_package = next(p for p in arch["packages"] if p["name"] == package_name)
-                evr = resolved_package["evr"]
-            except StopIteration:
-                evr = None
-
-            evrs[arch["arch"]] = evr
+        evrs = {arch: arch_evrs.get(package_name) for arch, arch_evrs in evrs_by_arch.items()}
 
         match list(set(evrs.values())):
             case [evr] if evr is not None:
@@ -273,7 +249,6 @@ def list_rpms(project_root: Path) -> list[RPMPackage]:
 
 def list_local_tools(project_root: Path) -> list[LocalPackage]:
     local_tools: list[LocalPackage] = []
-    version_re = re.compile(r"^VERSION=['\"]?(\d+\.\d+(\.\d+)?)['\"]?", re.MULTILINE)
 
     for local_tool_dir in sorted(project_root.joinpath("local-tools").iterdir()):
         if not local_tool_dir.is_dir():
@@ -286,7 +261,7 @@ def list_local_tools(project_root: Path) -> list[LocalPackage]:
             )
 
         content = script.read_text()
-        match = version_re.search(content)
+        match = LOCAL_TOOL_VERSION_RE.search(content)
 
         if not match:
             raise ValueError(
@@ -1,15 +1,48 @@
 #!/usr/bin/env bash
 set -o errexit -o nounset -o pipefail
 
-VERSION="1.0.0"
+VERSION="1.1.0"
 SCRIPT_NAME=$(basename "${BASH_SOURCE[0]}")
 
+# The exit code of attempts killed because of RETRY_ATTEMPT_TIMEOUT (same as timeout(1))
+TIMEOUT_EXIT_CODE=124
+
+# The prefix of the log messages, batch mode adds the number of the command
+LOG_PREFIX="retry"
+# In batch mode, if this file exists, the commands stop retrying (see run_batch)
+BATCH_CANCEL_FILE=""
+# With RETRY_VIRTUAL_TIME, how far the clock moved ahead of the real time (in microseconds)
+VIRTUAL_TIME_OFFSET=0
+# The process groups of the running attempt, if it doesn't run in the foreground (see
+# trap_signals)
+ATTEMPT_GROUPS=()
+
 # Configuration
 : "${RETRY_BASE_DELAY=1}"
 : "${RETRY_FACTOR=2}"
 : "${RETRY_MAX_TRIES=10}"
+: "${RETRY_JITTER=none}"
+: "${RETRY_MAX_DELAY=}"
+: "${RETRY_MAX_TIME=}"
+: "${RETRY_ATTEMPT_TIMEOUT=}"
+: "${RETRY_KILL_AFTER=10}"
+: "${RETRY_HEDGE_AFTER=}"
+: "${RETRY_MAX_HEDGES=1}"
 : "${RETRY_STOP_IF_STDERR_MATCHES=}"
+: "${RETRY_STDERR_TAIL_SIZE=4096}"
+: "${RETRY_THROTTLE_IF_STDERR_MATCHES=}"
+: "${RETRY_THROTTLE_MULTIPLIER=4}"
+: "${RETRY_AFTER_PATTERN=}"
+: "${RETRY_AFTER_MAX_DELAY=300}"
 : "${RETRY_STOP_ON_EXIT_CODES=}"
+: "${RETRY_STATE_DIR=}"
+: "${RETRY_STATE_KEY=default}"
+: "${RETRY_BREAKER_THRESHOLD=5}"
+: "${RETRY_BREAKER_COOLDOWN=30}"
+: "${RETRY_METRICS_FILE=}"
+: "${RETRY_BATCH_CONCURRENCY=4}"
+: "${RETRY_BATCH_FAIL_FAST=false}"
+: "${RETRY_VIRTUAL_TIME=false}"
 
 print_version() {
     printf "%s %s\n" "$SCRIPT_NAME" "$VERSION"
@@ -18,6 +51,7 @@ print_version() {
 print_usage() {
     cat << EOF
 Usage: $SCRIPT_NAME [--version] <command>
+       $SCRIPT_NAME --batch [<file>]
 
 Re-runs the provided command until it suceeds or until the maximum number of attempts
 is reached. Follows exponential backoff between attempts. Specifically, the wait time
@@ -28,6 +62,40 @@ before a retry follows this formula:
 With base=1, backoff_factor=2 and 10 total attempts, the wait sequence is:
     [1, 2, 4, 8, 16, 32, 64, 128, 256]
 
+Many clients failing at the same moment (e.g. when a registry has an outage) would
+all retry at the same moments as well. To spread the retries out, use a jitter strategy:
+
+    none            the formula above (the default)
+    full            wait_before(N-th retry) = random(0, base * backoff_factor ** (N - 1))
+    decorrelated    wait_before(N-th retry) = random(base, 3 * wait_before(N-1-th retry)),
+                    where wait_before(0-th retry) = base
+
+For all strategies, the wait time is capped at RETRY_MAX_DELAY (if set).
+
+Registries often throttle clients (e.g. HTTP 429 Too Many Requests). If enabled and
+the stderr of an attempt says that the command got throttled
+(RETRY_THROTTLE_IF_STDERR_MATCHES), the wait time before the next attempt is longer
+(multiplied by RETRY_THROTTLE_MULTIPLIER). If the stderr says how long to wait
+(RETRY_AFTER_PATTERN), wait that long instead (but at most RETRY_AFTER_MAX_DELAY and
+RETRY_MAX_DELAY). Both are disabled by default.
+
+Many retry processes (e.g. all the steps and sidecars in a pod) can share a circuit breaker
+to not overload a struggling service together. To enable it, set RETRY_STATE_DIR to
+a directory that all the processes can access. Processes with the same RETRY_STATE_KEY
+count failed attempts together. After RETRY_BREAKER_THRESHOLD failed attempts in a row
+(a successful attempt resets the count), the breaker opens and no process starts
+an attempt for RETRY_BREAKER_COOLDOWN seconds. Then the breaker is half-open: only one
+process makes a trial attempt, the others wait for its result (at most for another
+RETRY_BREAKER_COOLDOWN seconds). If the trial succeeds, the breaker closes, if it fails,
+the breaker opens again right away.
+
+In batch mode, reads commands from a file (or stdin, if the file is - or missing), one
+shell command per line (empty lines and lines starting with # are ignored). Runs up to
+RETRY_BATCH_CONCURRENCY of them at the same time, each one with the retry policy
+described here. At the end, prints a summary of the results. The exit code is 0 if all
+the commands succeeded, otherwise the exit code of the first failed command in the file
+(not the one that failed first, that would depend on the timing).
+
 Configuration (environment variables):
 
     RETRY_BASE_DELAY=$RETRY_BASE_DELAY
@@ -39,13 +107,110 @@ Configuration (environment variables):
     RETRY_MAX_TRIES=$RETRY_MAX_TRIES
         The total number of attempts (including the initial one)
 
+    RETRY_JITTER=$RETRY_JITTER
+        The jitter strategy: none, full or decorrelated (see above)
+
+    RETRY_MAX_DELAY=$RETRY_MAX_DELAY
+        The maximum wait time between attempts, in seconds. If empty or unset, no maximum.
+
+    RETRY_MAX_TIME=$RETRY_MAX_TIME
+        The maximum total time, in seconds. Stop retrying if the next attempt would start
+        later than this many seconds after the first one. If empty or unset, no maximum.
+
+    RETRY_ATTEMPT_TIMEOUT=$RETRY_ATTEMPT_TIMEOUT
+        The maximum time of a single attempt, in seconds. If an attempt runs longer, send
+        SIGTERM to its process group (the command and all its child processes), then
+        SIGKILL after RETRY_KILL_AFTER seconds. The attempt then fails with exit code
+        $TIMEOUT_EXIT_CODE and can be retried. If empty or unset, no maximum.
+        Note: with a timeout, the command runs in the background (in its own process
+        group), it cannot read from the terminal. Retry forwards SIGINT, SIGTERM and
+        SIGHUP to the process group, then exits.
+
+    RETRY_KILL_AFTER=$RETRY_KILL_AFTER
+        How long to wait for a timed out attempt to exit after SIGTERM, in seconds
+
+    RETRY_HEDGE_AFTER=$RETRY_HEDGE_AFTER
+        Only for idempotent commands (e.g. skopeo inspect)! If an attempt is still running
+        after this many seconds, start another copy of the command, without stopping the
+        first one (a hedged request). The first copy that succeeds wins, the others get
+        SIGTERM (SIGKILL after RETRY_KILL_AFTER seconds). The attempt fails only if all
+        the copies fail. Each copy runs in its own process group, with stdin from
+        /dev/null (retry forwards SIGINT, SIGTERM and SIGHUP to all the running copies).
+        The stdout of the copies gets buffered in temporary files, retry prints only
+        the stdout of the winner (or of the last copy that failed).
+        If empty or unset, don't hedge.
+
+    RETRY_MAX_HEDGES=$RETRY_MAX_HEDGES
+        The maximum number of hedged copies per attempt (in addition to the first one).
+        A new copy starts every RETRY_HEDGE_AFTER seconds until there are this many.
+
     RETRY_STOP_IF_STDERR_MATCHES=$RETRY_STOP_IF_STDERR_MATCHES
-        Stop retrying if the stderr contains this pattern ('grep -i -E' semantics)
+        Stop retrying if any line of the stderr matches this pattern (a case-insensitive
+        extended regular expression, 'grep -i -E' semantics)
+
+    RETRY_STDERR_TAIL_SIZE=$RETRY_STDERR_TAIL_SIZE
+        How many bytes from the end of the stderr of each attempt to keep. Retry matches
+        the stderr line by line as the command writes it, it doesn't store the whole stderr.
+        It does hold a whole line in memory, output that never ends its lines (e.g.
+        progress bars that only use carriage returns) counts as a single long line.
+
+    RETRY_THROTTLE_IF_STDERR_MATCHES=$RETRY_THROTTLE_IF_STDERR_MATCHES
+        If any line of the stderr matches this pattern (same semantics as for
+        RETRY_STOP_IF_STDERR_MATCHES), treat the attempt as throttled. If empty or unset,
+        don't detect throttling. Anchor the numbers in the pattern, e.g.
+        '(^|[^0-9])429([^0-9]|\$)|too many requests', otherwise they match digests etc.
+
+    RETRY_THROTTLE_MULTIPLIER=$RETRY_THROTTLE_MULTIPLIER
+        Multiply the wait time after throttled attempts by this number
+
+    RETRY_AFTER_PATTERN=$RETRY_AFTER_PATTERN
+        If any line of the stderr matches this pattern, the first number in the matching
+        part is the time to wait before the next attempt, in seconds (a server-suggested
+        wait, e.g. the Retry-After header). If more lines match, the last one wins.
+        If empty or unset, ignore such hints. Example: 'retry[-_ ]?after[": =]*[0-9]+'
+
+    RETRY_AFTER_MAX_DELAY=$RETRY_AFTER_MAX_DELAY
+        The maximum wait time suggested by the stderr (RETRY_AFTER_PATTERN) to accept,
+        in seconds. Longer suggestions get capped to this value.
 
     RETRY_STOP_ON_EXIT_CODES=$RETRY_STOP_ON_EXIT_CODES
         Stop retrying if the exit code is one of these comma-separated exit codes.
         If empty or unset, stops only on success (exit code 0).
 
+    RETRY_STATE_DIR=$RETRY_STATE_DIR
+        The directory for the shared circuit breaker state (see above). If empty or unset,
+        each retry process works on its own. Requires flock.
+
+    RETRY_STATE_KEY=$RETRY_STATE_KEY
+        Which circuit breaker to use, e.g. the hostname of the registry
+
+    RETRY_BREAKER_THRESHOLD=$RETRY_BREAKER_THRESHOLD
+        How many failed attempts in a row open the circuit breaker
+
+    RETRY_BREAKER_COOLDOWN=$RETRY_BREAKER_COOLDOWN
+        How long the circuit breaker stays open, in seconds
+
+    RETRY_METRICS_FILE=$RETRY_METRICS_FILE
+        Append a JSON record about this invocation to this file (one record per line):
+            {"command": [...], "exit_code": 1, "stop_reason": "max_tries",
+             "start_time": 1760000000.123, "total_time": 3.05, "total_sleep": 3,
+             "attempts": [{"exit_code": 1, "duration": 0.01, "timed_out": false}, ...]}
+        The stop reason is one of success, exit_code, stderr_matches, max_tries,
+        max_time or cancelled (batch mode). Requires flock. If empty or unset, don't
+        write any metrics.
+
+    RETRY_BATCH_CONCURRENCY=$RETRY_BATCH_CONCURRENCY
+        Batch mode: how many commands to run at the same time
+
+    RETRY_BATCH_FAIL_FAST=$RETRY_BATCH_FAIL_FAST
+        Batch mode: if true, when a command fails, don't start any more commands and
+        make the running commands stop retrying. If false, run all the commands.
+
+    RETRY_VIRTUAL_TIME=$RETRY_VIRTUAL_TIME
+        For testing. If true, don't wait between attempts, only pretend to: log the wait
+        and move the clock forward (for RETRY_MAX_TIME and the metrics). The timeouts,
+        hedging and the circuit breaker cooldown still use the real time.
+
 Example:
 
     $SCRIPT_NAME buildah push quay.io/konflux-ci/foo:0.2.1
@@ -53,68 +218,925 @@ Example:
     # skopeo returns 2 for e.g. non-existent image
     export RETRY_STOP_ON_EXIT_CODES=2
     $SCRIPT_NAME skopeo inspect --raw docker://quay.io/konflux-ci/foo@sha256:1234567
+
+    # Randomized waits of at most 1 minute, give up after 10 minutes
+    RETRY_JITTER=decorrelated RETRY_MAX_DELAY=60 RETRY_MAX_TIME=600 \
+        $SCRIPT_NAME buildah push quay.io/konflux-ci/foo:0.2.1
+
+    # Wait longer if the registry throttles us, or as long as it asks for
+    export RETRY_THROTTLE_IF_STDERR_MATCHES='(^|[^0-9])429([^0-9]|\$)|too many requests'
+    export RETRY_AFTER_PATTERN='retry[-_ ]?after[": =]*[0-9]+'
+    $SCRIPT_NAME skopeo copy docker://foo docker://bar
+
+    # Kill attempts that hang for more than 5 minutes
+    RETRY_ATTEMPT_TIMEOUT=300 $SCRIPT_NAME skopeo copy docker://foo docker://bar
+
+    # If inspecting takes more than 10 seconds, try again concurrently
+    RETRY_HEDGE_AFTER=10 $SCRIPT_NAME skopeo inspect docker://quay.io/konflux-ci/foo:0.2.1
+
+    # Share a circuit breaker with other steps in the pod (/shared is an emptyDir volume)
+    RETRY_STATE_DIR=/shared/retry RETRY_STATE_KEY=quay.io \
+        $SCRIPT_NAME skopeo copy docker://quay.io/foo docker://quay.io/bar
+
+    # Copy many images, 8 at a time
+    RETRY_BATCH_CONCURRENCY=8 $SCRIPT_NAME --batch < copy-commands.txt
 EOF
 }
 
 log() {
-    local format_string="[retry] $1\n"
+    local format_string="[$LOG_PREFIX] $1\n"
     shift
 
     # shellcheck disable=SC2059  # we intentionally use a variable as the format string
     printf "$format_string" "$@" >&2
 }
 
+# Bash only supports integer math, do the time math in microseconds. Converts a decimal
+# number of seconds to microseconds and stores the result in the variable named $1.
+to_micros() {
+    # The local variables have a prefix, to not shadow the output variable
+    local _seconds=$2
+    local _whole=${_seconds%%.*}
+    local _fraction=""
+    if [[ $_seconds == *.* ]]; then
+        _fraction=${_seconds#*.}
+    fi
+    _fraction="${_fraction}000000"
+    printf -v "$1" "%d" "$((10#${_whole:-0} * 1000000 + 10#${_fraction:0:6}))"
+}
+
+# Formats microseconds as a decimal number of seconds, stores it in the variable named $1
+format_seconds() {
+    local _micros=$2
+    local _seconds
+    printf -v _seconds "%d.%06d" "$((_micros / 1000000))" "$((_micros % 1000000))"
+    while [[ $_seconds == *0 ]]; do
+        _seconds=${_seconds%0}
+    done
+    printf -v "$1" "%s" "${_seconds%.}"
+}
+
+# Microseconds since the Unix epoch, stores the result in the variable named $1
+now_micros() {
+    # Strip the decimal separator (a dot or a comma, depending on the locale)
+    printf -v "$1" "%d" "$((10#${EPOCHREALTIME//[!0-9]/} + VIRTUAL_TIME_OFFSET))"
+}
+
+# Wait between attempts, the wait time is in microseconds (see RETRY_VIRTUAL_TIME)
+backoff_sleep() {
+    local micros=$1
+    if [[ $RETRY_VIRTUAL_TIME == true ]]; then
+        VIRTUAL_TIME_OFFSET=$((VIRTUAL_TIME_OFFSET + micros))
+    else
+        local seconds
+        format_seconds seconds "$micros"
+        sleep "$seconds"
+    fi
+}
+
+# Don't let the exponential backoff overflow, 2^40 microseconds is about 12 days
+MAX_DELAY_MICROS=$((2 ** 40))
+
+# Compute the wait time before the N-th retry (in microseconds), given the wait time before
+# the previous one. Stores the result in the variable named $1.
+backoff_delay() {
+    local _nth_retry=$2
+    local _previous_delay=$3
+    local _delay
+
+    local _base _max_delay _factor_millis
+    to_micros _base "$RETRY_BASE_DELAY"
+    to_micros _max_delay "${RETRY_MAX_DELAY:-0}"
+    to_micros _factor_millis "$RETRY_FACTOR"
+    _factor_millis=$((_factor_millis / 1000))
+
+    if [[ $RETRY_JITTER == decorrelated ]]; then
+        _delay=$((_base + (_previous_delay * 3 - _base) * RANDOM / 32767))
+    else
+        _delay=$_base
+        local _n
+        for ((_n = 1; _n < _nth_retry && _delay < MAX_DELAY_MICROS; _n++)); do
+            _delay=$((_delay * _factor_millis / 1000))
+        done
+    fi
+
+    if [[ -n "$RETRY_MAX_DELAY" ]] && ((_delay > _max_delay)); then
+        _delay=$_max_delay
+    elif ((_delay > MAX_DELAY_MICROS)); then
+        _delay=$MAX_DELAY_MICROS
+    fi
+
+    if [[ $RETRY_JITTER == full ]]; then
+        _delay=$((_delay * RANDOM / 32767))
+    fi
+
+    printf -v "$1" "%d" "$_delay"
+}
+
+# The awk program that keeps only the last TAIL_SIZE bytes of the stderr of an attempt
+# (whole lines, except for a line longer than that, which gets cut from the start)
+# shellcheck disable=SC2016  # the $ signs are for awk
+TAIL_STDERR_AWK='
+BEGIN {
+    tail_size = ENVIRON["TAIL_SIZE"] + 0
+    first = 1
+    last = 0
+    tail_bytes = 0
+}
+tail_size > 0 {
+    line = $0
+    if (length(line) >= tail_size) {
+        line = substr(line, length(line) - tail_size + 2)
+    }
+    lines[++last] = line
+    tail_bytes += length(line) + 1
+    while (tail_bytes > tail_size) {
+        tail_bytes -= length(lines[first]) + 1
+        delete lines[first++]
+    }
+}
+END {
+    for (i = first; i <= last; i++) {
+        print lines[i]
+    }
+}
+'
+
+# Read the number that 'grep -c' wrote to a file, store it in the variable named $1.
+# Stores 0 if grep didn't write anything (e.g. because of an invalid pattern).
+read_count() {
+    local _count=0
+    if [[ -s "$2" ]]; then
+        read -r _count < "$2"
+    fi
+    printf -v "$1" "%d" "$_count"
+}
+
+# Pass the stderr of an attempt (stdin) through to the real stderr. At the same time, match
+# the patterns ('grep -i -E') and keep the tail (awk), all of them read the stderr as
+# a stream. At the end, write the results to the stderr-result and stderr-tail files in
+# the state dir.
+capture_stderr() {
+    local state_dir=$1
+
+    local fd fds=() pids=() outputs=()
+    exec {fd}> >(TAIL_SIZE=$RETRY_STDERR_TAIL_SIZE LC_ALL=C awk "$TAIL_STDERR_AWK" \
+        > "$state_dir/stderr-tail")
+    fds+=("$fd") pids+=("$!")
+
+    if [[ -n "$RETRY_STOP_IF_STDERR_MATCHES" ]]; then
+        exec {fd}> >(grep -i -E -c -e "$RETRY_STOP_IF_STDERR_MATCHES" > "$state_dir/stop-count")
+        fds+=("$fd") pids+=("$!")
+    fi
+    if [[ -n "$RETRY_THROTTLE_IF_STDERR_MATCHES" ]]; then
+        exec {fd}> >(grep -i -E -c -e "$RETRY_THROTTLE_IF_STDERR_MATCHES" \
+            > "$state_dir/throttle-count")
+        fds+=("$fd") pids+=("$!")
+    fi
+    if [[ -n "$RETRY_AFTER_PATTERN" ]]; then
+        # Only the matching parts of the lines, the last one wins. With -a, grep prints them
+        # even if the stderr looks like binary data.
+        exec {fd}> >(grep -a -i -E -o -e "$RETRY_AFTER_PATTERN" | tail -n 1 \
+            > "$state_dir/retry-after-match")
+        fds+=("$fd") pids+=("$!")
+    fi
+
+    for fd in "${fds[@]}"; do
+        outputs+=("/dev/fd/$fd")
+    done
+    tee "${outputs[@]}" >&2
+
+    for fd in "${fds[@]}"; do
+        exec {fd}>&-
+    done
+    local pid
+    for pid in "${pids[@]}"; do
+        wait "$pid" || true
+    done
+
+    local stop_count throttle_count retry_after=- hint=""
+    read_count stop_count "$state_dir/stop-count"
+    read_count throttle_count "$state_dir/throttle-count"
+    if [[ -s "$state_dir/retry-after-match" ]]; then
+        read -r hint < "$state_dir/retry-after-match"
+    fi
+    # The first number in the matching part is the suggested wait time
+    if [[ $hint =~ [0-9]+(\.[0-9]+)? ]]; then
+        retry_after=${BASH_REMATCH[0]}
+        throttle_count=$((throttle_count + 1))
+    fi
+
+    printf "%d %d %s\n" "$((stop_count > 0))" "$((throttle_count > 0))" "$retry_after" \
+        > "$state_dir/stderr-result"
+    rm -f "$state_dir/stop-count" "$state_dir/throttle-count" "$state_dir/retry-after-match"
+}
+
+# Start a command in the background, in its own process group. The pid is in $!, the process
+# group gets added to ATTEMPT_GROUPS.
+start_in_group() {
+    # With job control enabled, background jobs run in their own process groups
+    set -m
+    "$@" &
+    set +m
+    ATTEMPT_GROUPS+=("$!")
+}
+
+# Wait for any of the given background processes to finish. Stores the pid of the finished
+# process in the variable named $1, returns its exit status.
+wait_any() {
+    local _pid
+    while true; do
+        # When more processes finish at the same time, bash may forget the jobs that
+        # 'wait -n' didn't return. 'wait <pid>' still knows their exit status.
+        for _pid in "${@:2}"; do
+            if ! kill -0 "$_pid" 2>/dev/null; then
+                printf -v "$1" "%s" "$_pid"
+                wait "$_pid"
+                return
+            fi
+        done
+
+        printf -v "$1" "%s" ""
+        local _status=0
+        wait -n -p "$1" "${@:2}" 2>/dev/null || _status=$?
+        if [[ -n "${!1}" ]]; then
+            return "$_status"
+        fi
+    done
+}
+
+# Send a signal to the process groups of the given processes (process group leaders)
+kill_groups() {
+    local signal=$1
+    shift
+
+    local pid
+    for pid in "$@"; do
+        kill "-$signal" -- "-$pid" 2>/dev/null || true
+    done
+}
+
+# Forward the signal to the process groups of the running attempt, then exit with the exit
+# code of a process killed by the signal
+forward_signal() {
+    local signal=$1
+    kill_groups "$signal" "${ATTEMPT_GROUPS[@]}"
+    exit "$((128 + $(kill -l "$signal")))"
+}
+
+# Attempts running in their own process groups don't get the signals meant for retry (e.g.
+# Ctrl-C or SIGTERM), forward them to ATTEMPT_GROUPS while the attempt is running
+trap_signals() {
+    local signal
+    for signal in INT TERM HUP; do
+        # shellcheck disable=SC2064  # expand now
+        trap "forward_signal $signal" "$signal"
+    done
+}
+
+untrap_signals() {
+    trap - INT TERM HUP
+    ATTEMPT_GROUPS=()
+}
+
+# Run one attempt of the command with hedging (see RETRY_HEDGE_AFTER). Waits for the copies
+# of the command and for the timers (hedging, RETRY_ATTEMPT_TIMEOUT, RETRY_KILL_AFTER)
+# at the same time, reacts to whichever finishes first.
+run_hedged_attempt() {
+    local state_dir=$1
+    shift
+
+    # The running copies ({pid: copy number})
+    local -A copies=()
+    local n_copies=1 winner="" last_failed=1 status=1 timed_out=0
+    trap_signals
+    start_in_group "$@" < /dev/null > "$state_dir/stdout-1"
+    copies[$!]=1
+
+    local hedge_timer="" timeout_timer="" kill_timer=""
+    if ((RETRY_MAX_HEDGES > 0)); then
+        start_in_group sleep "$RETRY_HEDGE_AFTER"
+        hedge_timer=$!
+    fi
+    if [[ -n "$RETRY_ATTEMPT_TIMEOUT" ]]; then
+        start_in_group sleep "$RETRY_ATTEMPT_TIMEOUT"
+        timeout_timer=$!
+    fi
+
+    local pid exit_code
+    while ((${#copies[@]} > 0)); do
+        exit_code=0
+        # Forward signals only to the copies and timers that are still running
+        # shellcheck disable=SC2206  # the timers are empty if not running
+        ATTEMPT_GROUPS=("${!copies[@]}" $hedge_timer $timeout_timer $kill_timer)
+        # shellcheck disable=SC2086  # the timers are empty if not running
+        wait_any pid "${!copies[@]}" $hedge_timer $timeout_timer $kill_timer || exit_code=$?
+
+        if [[ $pid == "$hedge_timer" ]]; then
+            hedge_timer=""
+            if [[ -z "$winner" ]] && ((!timed_out)); then
+                n_copies=$((n_copies + 1))
+                log "copy %d is still running after %s seconds, starting copy %d" \
+                    "$((n_copies - 1))" "$RETRY_HEDGE_AFTER" "$n_copies"
+                start_in_group "$@" < /dev/null > "$state_dir/stdout-$n_copies"
+                copies[$!]=$n_copies
+                if ((n_copies <= RETRY_MAX_HEDGES)); then
+                    start_in_group sleep "$RETRY_HEDGE_AFTER"
+                    hedge_timer=$!
+                fi
+            fi
+            continue
+        elif [[ $pid == "$timeout_timer" ]]; then
+            timeout_timer=""
+            timed_out=1
+            touch "$state_dir/timed-out"
+            kill_groups TERM "${!copies[@]}"
+            start_in_group sleep "$RETRY_KILL_AFTER"
+            kill_timer=$!
+            continue
+        elif [[ $pid == "$kill_timer" ]]; then
+            kill_timer=""
+            kill_groups KILL "${!copies[@]}"
+            continue
+        fi
+
+        local copy=${copies[$pid]}
+        unset "copies[$pid]"
+        if [[ -n "$winner" ]] || ((timed_out)); then
+            continue
+        fi
+
+        if ((exit_code == 0)); then
+            winner=$copy
+            status=0
+            if ((${#copies[@]} > 0)); then
+                log "copy %d succeeded, stopping the other copies" "$copy"
+                kill_groups TERM "${!copies[@]}"
+                start_in_group sleep "$RETRY_KILL_AFTER"
+                kill_timer=$!
+            fi
+        else
+            last_failed=$copy
+            status=$exit_code
+        fi
+    done
+
+    local timer
+    for timer in $hedge_timer $timeout_timer $kill_timer; do
+        kill "$timer" 2>/dev/null || true
+        wait "$timer" 2>/dev/null || true
+    done
+    untrap_signals
+
+    cat "$state_dir/stdout-${winner:-$last_failed}"
+    rm "$state_dir"/stdout-*
+    return "$status"
+}
+
+# Run one attempt of the command. With RETRY_ATTEMPT_TIMEOUT, kill the attempt (the whole
+# process group) if it runs for too long and create the $state_dir/timed-out file.
+run_attempt() {
+    local state_dir=$1
+    shift
+
+    if [[ -n "$RETRY_HEDGE_AFTER" ]]; then
+        run_hedged_attempt "$state_dir" "$@"
+        return
+    fi
+
+    if [[ -z "$RETRY_ATTEMPT_TIMEOUT" ]]; then
+        # Run in the foreground, the command can read from the terminal
+        "$@"
+        return
+    fi
+
+    trap_signals
+    # With job control enabled, background jobs run in their own process groups
+    set -m
+    "$@" &
+    local pid=$!
+    ATTEMPT_GROUPS=("$pid")
+
+    (
+        sleep "$RETRY_ATTEMPT_TIMEOUT"
+        touch "$state_dir/timed-out"
+        if ! kill -TERM -- "-$pid" 2>/dev/null; then
+            # Finished just now, didn't time out after all
+            rm "$state_dir/timed-out"
+            exit 0
+        fi
+        sleep "$RETRY_KILL_AFTER"
+        kill -KILL -- "-$pid" 2>/dev/null || true
+    ) >/dev/null 2>&1 &
+    local watchdog_pid=$!
+    ATTEMPT_GROUPS+=("$watchdog_pid")
+    set +m
+
+    local status=0
+    wait "$pid" || status=$?
+
+    # Kill the whole watchdog group, including the sleep (would keep the fds open otherwise)
+    kill -TERM -- "-$watchdog_pid" 2>/dev/null || true
+    wait "$watchdog_pid" 2>/dev/null || true
+    untrap_signals
+
+    return "$status"
+}
+
+# The files of the shared circuit breaker (if RETRY_STATE_DIR is set). The state file
+# contains the number of failed attempts in a row, the time until which the breaker is open
+# and the time until which a process holds the trial attempt of the half-open breaker (both
+# in microseconds since the Unix epoch). Access it only while holding the lock.
+breaker_files() {
+    local key=${RETRY_STATE_KEY//[!A-Za-z0-9._-]/_}
+    BREAKER_STATE_FILE="$RETRY_STATE_DIR/$key.breaker"
+    BREAKER_LOCK_FILE="$RETRY_STATE_DIR/$key.breaker.lock"
+}
+
+# Whether this process holds the trial attempt of the half-open breaker
+BREAKER_TRIAL=0
+
+# Read the state of the circuit breaker into the breaker_* variables of the caller
+breaker_read() {
+    breaker_failures=0 breaker_open_until=0 breaker_trial_until=0
+    if [[ -s "$BREAKER_STATE_FILE" ]]; then
+        read -r breaker_failures breaker_open_until breaker_trial_until < "$BREAKER_STATE_FILE"
+    fi
+    breaker_trial_until=${breaker_trial_until:-0}
+}
+
+breaker_write() {
+    printf "%d %d %d\n" "$breaker_failures" "$breaker_open_until" "$breaker_trial_until" \
+        > "$BREAKER_STATE_FILE"
+}
+
+# How long to wait for the shared circuit breaker (in microseconds, 0 if it's closed).
+# Stores the result in the variable named $1. After the cooldown, the breaker is half-open:
+# if nobody holds the trial attempt and the caller is about to start an attempt (there's
+# no other delay, $2 is 0), the caller gets the trial. Everybody else waits for the result.
+breaker_delay() {
+    local _pending_delay=$2
+    local _lock_fd _now _cooldown _delay=0
+    local breaker_failures breaker_open_until breaker_trial_until
+    exec {_lock_fd}>> "$BREAKER_LOCK_FILE"
+    flock --exclusive "$_lock_fd"
+    breaker_read
+
+    now_micros _now
+    if ((breaker_open_until > _now)); then
+        _delay=$((breaker_open_until - _now))
+    elif ((breaker_open_until > 0)); then
+        if ((breaker_trial_until > _now)); then
+            _delay=$((breaker_trial_until - _now))
+        elif ((_pending_delay == 0)); then
+            # If the trial never reports back (e.g. the process got killed), give it to
+            # somebody else after another cooldown
+            to_micros _cooldown "$RETRY_BREAKER_COOLDOWN"
+            breaker_trial_until=$((_now + _cooldown))
+            breaker_write
+            BREAKER_TRIAL=1
+            log "the circuit breaker for '%s' is half-open, making a trial attempt" \
+                "$RETRY_STATE_KEY"
+        fi
+    fi
+    exec {_lock_fd}>&-
+
+    printf -v "$1" "%d" "$_delay"
+}
+
+# Record the result of an attempt in the shared circuit breaker, open it if needed
+breaker_record() {
+    local succeeded=$1
+    local lock_fd now cooldown
+    local breaker_failures breaker_open_until breaker_trial_until
+    exec {lock_fd}>> "$BREAKER_LOCK_FILE"
+    flock --exclusive "$lock_fd"
+    breaker_read
+
+    now_micros now
+    to_micros cooldown "$RETRY_BREAKER_COOLDOWN"
+    if ((succeeded)); then
+        breaker_failures=0 breaker_open_until=0 breaker_trial_until=0
+    elif ((breaker_open_until > now)); then
+        # The attempt started before the breaker opened, it's already open
+        :
+    elif ((breaker_open_until > 0)); then
+        breaker_open_until=$((now + cooldown)) breaker_trial_until=0
+        log "the trial attempt for '%s' failed, opening the circuit breaker for %s seconds" \
+            "$RETRY_STATE_KEY" "$RETRY_BREAKER_COOLDOWN"
+    else
+        breaker_failures=$((breaker_failures + 1))
+        if ((breaker_failures >= RETRY_BREAKER_THRESHOLD)); then
+            breaker_open_until=$((now + cooldown))
+            log "%d failed attempts in a row for '%s', opening the circuit breaker for %s seconds" \
+                "$breaker_failures" "$RETRY_STATE_KEY" "$RETRY_BREAKER_COOLDOWN"
+        fi
+    fi
+
+    breaker_write
+    exec {lock_fd}>&-
+    BREAKER_TRIAL=0
+}
+
+# Give up the trial attempt without a result (e.g. the attempt failed in a way that doesn't
+# say anything about the health of the service), the next waiting process makes the trial
+breaker_release() {
+    local lock_fd
+    local breaker_failures breaker_open_until breaker_trial_until
+    exec {lock_fd}>> "$BREAKER_LOCK_FILE"
+    flock --exclusive "$lock_fd"
+    breaker_read
+    breaker_trial_until=0
+    breaker_write
+    exec {lock_fd}>&-
+    BREAKER_TRIAL=0
+}
+
+# Format a string as a JSON string, store the result in the variable named $1
+json_string() {
+    local _string=$2 _char _code
+    _string=${_string//\\/\\\\}
+    _string=${_string//\"/\\\"}
+    while [[ $_string =~ [[:cntrl:]] ]]; do
+        _char=${BASH_REMATCH[0]}
+        printf -v _code '\\u%04x' "'$_char"
+        _string=${_string//"$_char"/"$_code"}
+    done
+    printf -v "$1" '"%s"' "$_string"
+}
+
+# Append the metrics record of this invocation to RETRY_METRICS_FILE
+write_metrics() {
+    local status=$1
+    local stop_reason=$2
+    local start_time=$3
+    local total_sleep=$4
+    local attempts=$5
+    shift 5
+
+    local arg command=()
+    for arg in "$@"; do
+        json_string arg "$arg"
+        command+=("$arg")
+    done
+    local IFS=,
+
+    local now start_seconds total_time total_sleep_seconds
+    now_micros now
+    format_seconds start_seconds "$start_time"
+    format_seconds total_time "$((now - start_time))"
+    format_seconds total_sleep_seconds "$total_sleep"
+
+    local record
+    printf -v record '{%s, %s, %s, %s, %s, %s, %s}' \
+        "\"command\": [${command[*]}]" \
+        "\"exit_code\": $status" \
+        "\"stop_reason\": \"$stop_reason\"" \
+        "\"start_time\": $start_seconds" \
+        "\"total_time\": $total_time" \
+        "\"total_sleep\": $total_sleep_seconds" \
+        "\"attempts\": [$attempts]"
+
+    # Other retry processes may be writing to the same file
+    local lock_fd
+    exec {lock_fd}>> "$RETRY_METRICS_FILE"
+    flock --exclusive "$lock_fd"
+    printf '%s\n' "$record" >&"$lock_fd"
+    exec {lock_fd}>&-
+}
+
 retry() {
-    local status
+    local status=1
+    local start_time
+    now_micros start_time
 
-    local error_file
-    error_file=$(mktemp --tmpdir 'retry.XXXXXX')
-    trap 'rm "$error_file"' RETURN
+    local state_dir
+    state_dir=$(mktemp -d --tmpdir 'retry.XXXXXX')
+    # shellcheck disable=SC2064  # expand now, state_dir is a local variable
+    trap "rm -r '$state_dir'" RETURN
 
     local stop_on_exit_codes=()
     IFS=',' read -r -a stop_on_exit_codes <<< "$RETRY_STOP_ON_EXIT_CODES"
 
-    for i in $(seq 1 "$RETRY_MAX_TRIES"); do
+    local max_time
+    to_micros max_time "${RETRY_MAX_TIME:-0}"
+
+    local cmd_string
+    printf -v cmd_string ' %q' "$@"
+
+    local max_delay throttle_multiplier_millis retry_after_max_delay
+    to_micros max_delay "${RETRY_MAX_DELAY:-0}"
+    to_micros retry_after_max_delay "$RETRY_AFTER_MAX_DELAY"
+    to_micros throttle_multiplier_millis "$RETRY_THROTTLE_MULTIPLIER"
+    throttle_multiplier_millis=$((throttle_multiplier_millis / 1000))
+
+    # The results of processing the stderr of the last attempt
+    local stderr_matched=0 throttled=0 retry_after=-
+
+    if [[ -n "$RETRY_STATE_DIR" ]]; then
+        mkdir -p "$RETRY_STATE_DIR"
+        breaker_files
+    fi
+
+    # Why retry stopped and the details of the attempts (a list of JSON objects), for
+    # the metrics
+    local stop_reason="" attempts_json="" total_sleep=0
+
+    local waittime
+    to_micros waittime "$RETRY_BASE_DELAY"
+    local i current_time seconds delay breaker_wait
+    for ((i = 1; i <= RETRY_MAX_TRIES; i++)); do
         local nth_retry=$((i - 1))
-        local waittime
+        delay=0
+        if [[ $nth_retry -gt 0 && -n "$BATCH_CANCEL_FILE" && -e "$BATCH_CANCEL_FILE" ]]; then
+            log "giving up after %d attempts: another command in the batch failed" "$nth_retry"
+            stop_reason=cancelled
+            break
+        fi
+
         if [[ $nth_retry -gt 0 ]]; then
-            # Bash doesn't natively support floating-point math, use 'bc'
-            waittime=$(bc -l <<< "$RETRY_BASE_DELAY * $RETRY_FACTOR ^ ($nth_retry - 1)")
-            log "waiting for %g seconds before attempt %d..." "$waittime" "$i"
-            sleep "$waittime"
+            backoff_delay waittime "$nth_retry" "$waittime"
+
+            if [[ $retry_after != - ]]; then
+                log "attempt %d got throttled, the suggested wait time is %s seconds" \
+                    "$nth_retry" "$retry_after"
+                to_micros waittime "$retry_after"
+                if ((waittime > retry_after_max_delay)); then
+                    waittime=$retry_after_max_delay
+                fi
+            elif ((throttled)); then
+                log "attempt %d got throttled, increasing the wait time" "$nth_retry"
+                waittime=$((waittime * throttle_multiplier_millis / 1000))
+            fi
+            if [[ -n "$RETRY_MAX_DELAY" ]] && ((waittime > max_delay)); then
+                waittime=$max_delay
+            fi
+            delay=$waittime
         fi
 
-        log "executing:%s" "$(printf ' %q' "${@}")"
+        while true; do
+            if [[ -n "$RETRY_STATE_DIR" ]]; then
+                breaker_delay breaker_wait "$delay"
+                if ((breaker_wait > delay)); then
+                    log "the circuit breaker for '%s' is open" "$RETRY_STATE_KEY"
+                    delay=$breaker_wait
+                fi
+            fi
+            if ((delay == 0)); then
+                break
+            fi
+
+            format_seconds seconds "$delay"
+
+            now_micros current_time
+            if [[ -n "$RETRY_MAX_TIME" ]] &&
+                ((current_time - start_time + delay > max_time)); then
+                log "giving up after %d attempts: max time reached (%s seconds)" \
+                    "$nth_retry" "$RETRY_MAX_TIME"
+                stop_reason=max_time
+                break 2
+            fi
+
+            log "waiting for %s seconds before attempt %d..." "$seconds" "$i"
+            backoff_sleep "$delay"
+            total_sleep=$((total_sleep + delay))
+            # Other processes may have changed the circuit breaker meanwhile, check it again
+            delay=0
+        done
+
+        log "executing:%s" "$cmd_string"
+        local attempt_start
+        now_micros attempt_start
 
-        # Print stderr while executing but also write it to $error_file
-        if "$@" 2> >(tee "$error_file" >&2); then
-            return 0
+        # Print stderr while executing but also process it with capture_stderr. Use a
+        # separate fd for the capture, to be able to wait for it after the attempt.
+        local capture_fd capture_pid
+        exec {capture_fd}> >(capture_stderr "$state_dir")
+        capture_pid=$!
+
+        if run_attempt "$state_dir" "$@" 2>&"$capture_fd" {capture_fd}>&-; then
+            status=0
         else
             status=$?
         fi
 
+        exec {capture_fd}>&-
+        wait "$capture_pid" || true
+
+        now_micros current_time
+        format_seconds seconds "$((current_time - attempt_start))"
+        local timed_out=false
+        if [[ -e "$state_dir/timed-out" ]]; then
+            rm "$state_dir/timed-out"
+            status=$TIMEOUT_EXIT_CODE
+            timed_out=true
+            log "attempt %d timed out after %s seconds" "$i" "$seconds"
+        else
+            log "attempt %d finished in %s seconds with exit code %d" "$i" "$seconds" "$status"
+        fi
+        attempts_json+="${attempts_json:+, }{\"exit_code\": $status, \"duration\": $seconds"
+        attempts_json+=", \"timed_out\": $timed_out}"
+
+        if [[ $status -eq 0 ]]; then
+            if [[ -n "$RETRY_STATE_DIR" ]]; then
+                breaker_record 1
+            fi
+            stop_reason=success
+            break
+        fi
+
         for stop_on_code in "${stop_on_exit_codes[@]}"; do
             if [[ $status -eq "$stop_on_code" ]]; then
                 log "giving up after %d attempts: exit code is %d" "$i" "$status"
-                return "$status"
+                stop_reason=exit_code
+                if ((BREAKER_TRIAL)); then
+                    breaker_release
+                fi
+                break 2
             fi
         done
 
-        if [[ -n "$RETRY_STOP_IF_STDERR_MATCHES" ]]; then
-            if grep -i -E -q "$RETRY_STOP_IF_STDERR_MATCHES" "$error_file"; then
-                log "giving up after %d attempts: stderr matches '%s'" \
-                    "$i" "$RETRY_STOP_IF_STDERR_MATCHES"
-                return "$status"
+        read -r stderr_matched throttled retry_after < "$state_dir/stderr-result" || true
+        if ((stderr_matched)); then
+            log "giving up after %d attempts: stderr matches '%s'" \
+                "$i" "$RETRY_STOP_IF_STDERR_MATCHES"
+            stop_reason=stderr_matches
+            if ((BREAKER_TRIAL)); then
+                breaker_release
             fi
+            break
+        fi
+
+        # Only count the failures worth retrying, e.g. a missing image doesn't mean that
+        # the registry has problems
+        if [[ -n "$RETRY_STATE_DIR" ]]; then
+            breaker_record 0
         fi
     done
 
-    log "giving up after %d attempts: max attempts reached" "$RETRY_MAX_TRIES"
+    if [[ -z "$stop_reason" ]]; then
+        log "giving up after %d attempts: max attempts reached" "$RETRY_MAX_TRIES"
+        stop_reason=max_tries
+    fi
+
+    if [[ -n "$RETRY_METRICS_FILE" ]]; then
+        write_metrics "$status" "$stop_reason" "$start_time" "$total_sleep" "$attempts_json" "$@"
+    fi
     return "$status"
 }
 
+# Run the commands from a file (one shell command per line), up to RETRY_BATCH_CONCURRENCY
+# at the same time, each one with the usual retry policy
+run_batch() {
+    local commands_file=$1
+    if [[ $commands_file == - ]]; then
+        commands_file=/dev/stdin
+    fi
+
+    local line commands=()
+    while IFS= read -r line || [[ -n "$line" ]]; do
+        if [[ ! $line =~ ^[[:space:]]*(#|$) ]]; then
+            commands+=("$line")
+        fi
+    done < "$commands_file"
+
+    local batch_dir
+    batch_dir=$(mktemp -d --tmpdir 'retry-batch.XXXXXX')
+    # shellcheck disable=SC2064  # expand now, batch_dir is a local variable
+    trap "rm -r '$batch_dir'" RETURN
+    BATCH_CANCEL_FILE="$batch_dir/cancel"
+
+    # The commands that are running ({pid: index}) and the results of the finished ones
+    local -A running=()
+    local start_times=() statuses=() durations=()
+    local n_commands=${#commands[@]} next=0 cancelled=false
+    local pid status now
+
+    while ((next < n_commands || ${#running[@]} > 0)); do
+        if ((next < n_commands && ${#running[@]} < RETRY_BATCH_CONCURRENCY)) &&
+            [[ ! -e "$BATCH_CANCEL_FILE" ]]; then
+            log "starting #%d: %s" "$((next + 1))" "${commands[next]}"
+            now_micros "start_times[next]"
+            (
+                LOG_PREFIX="retry #$((next + 1))"
+                retry bash -c "${commands[next]}"
+            ) < /dev/null &
+            running[$!]=$next
+            next=$((next + 1))
+            continue
+        fi
+
+        if ((${#running[@]} == 0)); then
+            # Cancelled, the remaining commands will not start
+            break
+        fi
+
+        status=0
+        wait_any pid "${!running[@]}" || status=$?
+        local i=${running[$pid]}
+        unset "running[$pid]"
+
+        now_micros now
+        statuses[i]=$status
+        format_seconds "durations[i]" "$((now - start_times[i]))"
+
+        if ((status != 0)) && [[ $RETRY_BATCH_FAIL_FAST == true && $cancelled == false ]]; then
+            log "#%d failed, cancelling the batch" "$((i + 1))"
+            touch "$BATCH_CANCEL_FILE"
+            cancelled=true
+        fi
+    done
+
+    local i succeeded=0 failed=0 skipped=0 exit_code=0
+    log "batch summary:"
+    for ((i = 0; i < n_commands; i++)); do
+        if [[ -z "${statuses[i]:-}" ]]; then
+            log "  #%d skipped: %s" "$((i + 1))" "${commands[i]}"
+            skipped=$((skipped + 1))
+        elif ((statuses[i] == 0)); then
+            log "  #%d succeeded in %s seconds: %s" "$((i + 1))" "${durations[i]}" "${commands[i]}"
+            succeeded=$((succeeded + 1))
+        else
+            log "  #%d failed in %s seconds with exit code %d: %s" \
+                "$((i + 1))" "${durations[i]}" "${statuses[i]}" "${commands[i]}"
+            failed=$((failed + 1))
+            if ((exit_code == 0)); then
+                exit_code=${statuses[i]}
+            fi
+        fi
+    done
+    log "%d succeeded, %d failed, %d skipped" "$succeeded" "$failed" "$skipped"
+
+    return "$exit_code"
+}
+
+is_number() {
+    [[ $1 =~ ^[0-9]+(\.[0-9]+)?$ ]]
+}
+
+check_config() {
+    case "$RETRY_JITTER" in
+        none | full | decorrelated) ;;
+        *)
+            log "error: unknown RETRY_JITTER strategy: '%s'" "$RETRY_JITTER"
+            return 1
+            ;;
+    esac
+
+    local name
+    for name in RETRY_BASE_DELAY RETRY_FACTOR RETRY_KILL_AFTER RETRY_THROTTLE_MULTIPLIER \
+        RETRY_AFTER_MAX_DELAY RETRY_BREAKER_COOLDOWN; do
+        if ! is_number "${!name}"; then
+            log "error: %s must be a number: '%s'" "$name" "${!name}"
+            return 1
+        fi
+    done
+
+    for name in RETRY_MAX_DELAY RETRY_MAX_TIME RETRY_ATTEMPT_TIMEOUT RETRY_HEDGE_AFTER; do
+        if [[ -n "${!name}" ]] && ! is_number "${!name}"; then
+            log "error: %s must be a number: '%s'" "$name" "${!name}"
+            return 1
+        fi
+    done
+
+    for name in RETRY_MAX_TRIES RETRY_STDERR_TAIL_SIZE RETRY_BREAKER_THRESHOLD \
+        RETRY_BATCH_CONCURRENCY RETRY_MAX_HEDGES; do
+        if ! [[ ${!name} =~ ^[0-9]+$ ]]; then
+            log "error: %s must be a whole number: '%s'" "$name" "${!name}"
+            return 1
+        fi
+    done
+
+    if ((RETRY_BATCH_CONCURRENCY < 1)); then
+        log "error: RETRY_BATCH_CONCURRENCY must be at least 1: '%s'" "$RETRY_BATCH_CONCURRENCY"
+        return 1
+    fi
+
+    for name in RETRY_BATCH_FAIL_FAST RETRY_VIRTUAL_TIME; do
+        case "${!name}" in
+            true | false) ;;
+            *)
+                log "error: %s must be true or false: '%s'" "$name" "${!name}"
+                return 1
+                ;;
+        esac
+    done
+
+    local timeout
+    to_micros timeout "${RETRY_ATTEMPT_TIMEOUT:-1}"
+    if ((timeout <= 0)); then
+        log "error: RETRY_ATTEMPT_TIMEOUT must be a positive number: '%s'" "$RETRY_ATTEMPT_TIMEOUT"
+        return 1
+    fi
+}
+
 check_dependencies() {
-    for cmd in bc grep; do
+    local dependencies=(awk grep tee)
+    if [[ -n "$RETRY_STATE_DIR" || -n "$RETRY_METRICS_FILE" ]]; then
+        dependencies+=(flock)
+    fi
+
+    for cmd in "${dependencies[@]}"; do
         if ! command -v "$cmd" >/dev/null; then
             log "error: missing '%s' executable" "$cmd"
             return 1
@@ -125,7 +1147,13 @@ check_dependencies() {
 case ${1:-'--help'} in
     --version) print_version ;;
     --help) print_usage ;;
+    --batch)
+        check_config
+        check_dependencies
+        run_batch "${2:--}"
+        ;;
     *)
+        check_config
         check_dependencies
         retry "$@"
         ;;
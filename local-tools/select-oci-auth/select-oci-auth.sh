@@ -4,7 +4,7 @@ set -o errexit
 set -o nounset
 set -o pipefail
 
-VERSION="1.0.0"
+VERSION="1.0.1"
 declare -r VERSION
 
 AUTHFILE="${AUTHFILE:-$HOME/.docker/config.json}"
@@ -72,6 +72,28 @@ print_auth() {
     fi
 }
 
+# Print the "<key> <token>" pairs (the token as one-line JSON) for the entries of .auths
+# whose key is one of the arguments. Parses the AUTHFILE only once, for all the keys.
+lookup_auths() {
+    local -a env_vars=()
+    local -a conditions=()
+    local i=0
+    local key
+    for key in "$@"; do
+        # Pass the keys as environment variables, they don't need any escaping that way
+        env_vars+=("SELECT_OCI_AUTH_KEY_$i=$key")
+        conditions+=(".key == strenv(SELECT_OCI_AUTH_KEY_$i)")
+        i=$((i + 1))
+    done
+
+    local condition
+    printf -v condition " or %s" "${conditions[@]}"
+    condition="${condition# or }"
+
+    local -r query="(.auths // {}) | to_entries | .[] | select($condition)"
+    < "$AUTHFILE" env "${env_vars[@]}" yq "$query | .key + \" \" + (.value | to_json(0))"
+}
+
 select_auth() {
     local -r image_ref="$1"
 
@@ -79,32 +101,39 @@ select_auth() {
     registry="${repo/\/*}"
 
     if [[ -f "$AUTHFILE" ]]; then
-        while true; do
-            token=$(< "$AUTHFILE" yq ".auths[\"$repo\"]")
-            if [[ "$token" != "null" ]]; then
-                >&2 printf "Using token for %s\n" "$repo"
-                print_auth "$registry" "$token" | yq .
-                exit 0
-            fi
-
-            if [[ "$repo" != *"/"* ]]; then
-                break
-            fi
-
+        # The keys to look for, longest prefix of the repo first, the registry last
+        local -a keys=("$repo")
+        while [[ "$repo" == *"/"* ]]; do
             repo="${repo%*/*}"
+            keys+=("$repo")
         done
 
         # For docker.io, check auth key https://index.docker.io/v1/
         # oras-login writes this key.
         if [ "$registry" = "docker.io" ]; then
-            registry="https://index.docker.io/v1/"
-            token=$(< "$AUTHFILE" yq '.auths["'$registry'"]')
+            keys+=("https://index.docker.io/v1/")
+        fi
+
+        local -A tokens=()
+        local matches
+        matches=$(lookup_auths "${keys[@]}")
+        if [[ -n "$matches" ]]; then
+            while read -r key token; do
+                tokens["$key"]=$token
+            done <<< "$matches"
+        fi
+
+        for key in "${keys[@]}"; do
+            token=${tokens["$key"]:-null}
             if [[ "$token" != "null" ]]; then
-                >&2 printf "Using token for %s\n" "$registry"
+                if [[ "$key" == "https://index.docker.io/v1/" ]]; then
+                    registry=$key
+                fi
+                >&2 printf "Using token for %s\n" "$key"
                 print_auth "$registry" "$token" | yq .
                 exit 0
             fi
-        fi
+        done
     fi
 
     >&2 printf "Token not found for %s\n" "$image_ref"
@@ -1,21 +1,68 @@
+import fcntl
 import logging
 import os
+from typing import Iterator
 
 import pytest
 
+from tests.utils.build_context import build_context_hash
 from tests.utils.container import Container
 from tests.constants import REPO_ROOT
 
 
 log = logging.getLogger(__name__)
 
+pytest_plugins = ["tests.utils.timing_plugin"]
+
+
+# Before the xdist hook that assigns the tests to the groups
+@pytest.hookimpl(tryfirst=True)
+def pytest_collection_modifyitems(config: pytest.Config, items: list[pytest.Item]) -> None:
+    # With --dist=loadgroup, pytest-xdist runs all the tests from a group on the same worker,
+    # one at a time => the exclusive tests never run concurrently with each other. They
+    # still run concurrently with the tests on the other workers, for full isolation run
+    # them in a separate pass without xdist (see the README).
+    if not config.pluginmanager.hasplugin("xdist"):
+        return
+    for item in items:
+        if item.get_closest_marker("exclusive"):
+            item.add_marker(pytest.mark.xdist_group("exclusive"))
+
 
 @pytest.fixture(scope="session")
-def task_runner_container() -> Container:
+def task_runner_container(tmp_path_factory: pytest.TempPathFactory) -> Iterator[Container]:
     if image_name := os.getenv("TEST_IMAGE"):
         log.info("Using existing TEST_IMAGE=%s", image_name)
-        return Container(image_name)
+        container = Container(image_name)
+    else:
+        # Tag the image with the hash of the build context, rebuild only if it changed
+        context_hash = build_context_hash(REPO_ROOT)
+        image_name = f"localhost/task-runner:test-{context_hash[:16]}"
+        # With pytest-xdist, each worker gets here. Only the first one to take the lock
+        # builds the image, the others wait and then re-use it. The parent of the basetemp
+        # directory is shared by all the workers.
+        lock_file = tmp_path_factory.getbasetemp().parent / "task-runner-image.lock"
+        with lock_file.open("w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if Container.image_exists(image_name):
+                log.info("Re-using Task Runner image (name=%s)", image_name)
+                container = Container(image_name)
+            else:
+                log.info("Building Task Runner image (name=%s)", image_name)
+                container = Container.build_image(REPO_ROOT, image_name)
+                _remove_old_test_images(image_name)
+
+    with container.session():
+        yield container
+
 
-    image_name = "localhost/task-runner:test"
-    log.info("Building Task Runner image (name=%s)", image_name)
-    return Container.build_image(REPO_ROOT, image_name)
+def _remove_old_test_images(image_name: str) -> None:
+    # Every change to the build context makes a new test-<hash> image, don't pile them up
+    repository, _, _ = image_name.rpartition(":")
+    for old_image in Container.list_images(f"{repository}:test-*"):
+        if old_image == image_name:
+            continue
+        log.info("Removing old Task Runner image (name=%s)", old_image)
+        if not Container.remove_image(old_image):
+            # E.g. another test session is still using it
+            log.warning("Failed to remove old Task Runner image (name=%s)", old_image)
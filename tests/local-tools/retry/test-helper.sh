@@ -50,14 +50,75 @@ fail_then_succeed() {
     fi
 }
 
+# Starts a child process (writes its PID to the pid file), then hangs
+hang() {
+    local pid_file="$1"
+    sleep 60 &
+    echo "$!" > "$pid_file"
+    wait
+}
+
+# Hangs and ignores SIGTERM
+hang_ignoring_sigterm() {
+    trap '' TERM
+    # Sleep in short intervals, so that bash gets to ignore the signal in between
+    for _ in $(seq 600); do
+        sleep 0.1
+    done
+}
+
+# Hangs on the first attempt (uses a state file), then succeeds
+hang_then_succeed() {
+    local state_file="$1"
+    if [[ ! -f "$state_file" ]]; then
+        touch "$state_file"
+        sleep 60
+    else
+        echo "Success!"
+        exit 0
+    fi
+}
+
+# On the first attempt (uses a state file), writes some stdout and hangs (writes the PID
+# of its child process to the pid file). Then succeeds.
+hang_with_output_then_succeed() {
+    local state_file="$1"
+    local pid_file="$2"
+    if [[ ! -f "$state_file" ]]; then
+        touch "$state_file"
+        echo "Partial output"
+        sleep 60 &
+        echo "$!" > "$pid_file"
+        wait
+    else
+        echo "Success!"
+        exit 0
+    fi
+}
+
+# Writes a lot of stderr (the size in MiB), then fails
+spam_stderr() {
+    local size_mib="$1"
+    # yes gets killed by SIGPIPE when head exits, ignore that
+    yes "Very verbose progress output, line after line after line" |
+        head -c "$((size_mib * 1024 * 1024))" >&2 || true
+    echo "Error: command failed" >&2
+    exit 1
+}
+
 case "${1:-}" in
     succeed) succeed ;;
     fail) fail ;;
     fail_with_code) fail_with_code "$2" ;;
     fail_with_stderr) fail_with_stderr "$2" ;;
     fail_then_succeed) fail_then_succeed "$2" "$3" ;;
+    hang) hang "$2" ;;
+    hang_ignoring_sigterm) hang_ignoring_sigterm ;;
+    hang_then_succeed) hang_then_succeed "$2" ;;
+    hang_with_output_then_succeed) hang_with_output_then_succeed "$2" "$3" ;;
+    spam_stderr) spam_stderr "$2" ;;
     *)
-        echo "Usage: $0 {succeed|fail|fail_with_code|fail_with_stderr|fail_then_succeed}" >&2
+        echo "Usage: $0 <scenario> [args...] (see the functions in this script)" >&2
         exit 1
         ;;
 esac
@@ -1,9 +1,13 @@
+import json
 import os
 import re
+import signal
 import subprocess
 import time
 from pathlib import Path
 
+import pytest
+
 from tests.constants import REPO_ROOT
 
 SCRIPT_FILE = "retry.sh"
@@ -79,6 +83,7 @@ def test_command_fails_all_attempts() -> None:
     assert "[retry] giving up after 3 attempts: max attempts reached" in proc.stderr
 
 
+@pytest.mark.exclusive
 def test_exponential_backoff_timing(tmp_path: Path) -> None:
     state_file = tmp_path / "state"
 
@@ -169,6 +174,20 @@ def test_stop_if_stderr_matches_case_insensitive() -> None:
     assert "[retry] giving up after 1 attempts: stderr matches 'unauthorized'" in proc.stderr
 
 
+def test_stop_if_stderr_matches_uppercase_pattern() -> None:
+    # The pattern is case-insensitive too (with any awk, the matching uses grep -i -E)
+    proc = run_retry(
+        "bash",
+        HELPER_SCRIPT,
+        "fail_with_stderr",
+        "unauthorized",
+        env={"RETRY_STOP_IF_STDERR_MATCHES": "Unauthorized|FORBIDDEN"},
+    )
+    assert proc.returncode == 1
+    assert proc.stderr.count("[retry] executing:") == 1
+    assert "[retry] giving up after 1 attempts: stderr matches" in proc.stderr
+
+
 def test_custom_retry_parameters(tmp_path: Path) -> None:
     state_file = tmp_path / "state"
 
@@ -223,3 +242,869 @@ def test_retries_continue_when_stderr_does_not_match(tmp_path: Path) -> None:
     assert proc.returncode == 0
     # Should retry and eventually succeed
     assert proc.stderr.count("[retry] executing:") == 3
+
+
+def parse_waits(stderr: str) -> list[float]:
+    return [float(wait) for wait in re.findall(r"\[retry\] waiting for (\S+) seconds", stderr)]
+
+
+def test_max_delay_caps_wait() -> None:
+    proc = run_retry(
+        "bash",
+        HELPER_SCRIPT,
+        "fail",
+        env={"RETRY_MAX_TRIES": "4", "RETRY_FACTOR": "10", "RETRY_MAX_DELAY": "0.005"},
+    )
+    assert proc.returncode == 1
+    # 0.001, 0.01 => 0.005, 0.1 => 0.005
+    assert parse_waits(proc.stderr) == [0.001, 0.005, 0.005]
+
+
+def test_full_jitter() -> None:
+    proc = run_retry(
+        "bash",
+        HELPER_SCRIPT,
+        "fail",
+        env={"RETRY_MAX_TRIES": "6", "RETRY_JITTER": "full", "RETRY_MAX_DELAY": "0.01"},
+    )
+    assert proc.returncode == 1
+
+    waits = parse_waits(proc.stderr)
+    assert len(waits) == 5
+    for nth_retry, wait in enumerate(waits, start=1):
+        assert 0 <= wait <= min(0.001 * 2 ** (nth_retry - 1), 0.01)
+
+
+def test_decorrelated_jitter() -> None:
+    proc = run_retry(
+        "bash",
+        HELPER_SCRIPT,
+        "fail",
+        env={"RETRY_MAX_TRIES": "6", "RETRY_JITTER": "decorrelated", "RETRY_MAX_DELAY": "0.01"},
+    )
+    assert proc.returncode == 1
+
+    waits = parse_waits(proc.stderr)
+    assert len(waits) == 5
+    previous_wait = 0.001
+    for wait in waits:
+        # Allow for the rounding of the printed values
+        assert 0.001 <= wait <= min(previous_wait * 3, 0.01) * 1.0001
+        previous_wait = wait
+
+
+def test_unknown_jitter_strategy() -> None:
+    proc = run_retry("bash", HELPER_SCRIPT, "succeed", env={"RETRY_JITTER": "random"})
+    assert proc.returncode == 1
+    assert "[retry] error: unknown RETRY_JITTER strategy: 'random'" in proc.stderr
+    assert "[retry] executing:" not in proc.stderr
+
+
+def test_max_time() -> None:
+    # The first retry would start after 0.2 seconds, exceeds the max time
+    proc = run_retry(
+        "bash",
+        HELPER_SCRIPT,
+        "fail",
+        env={"RETRY_BASE_DELAY": "0.2", "RETRY_MAX_TIME": "0.1"},
+    )
+    assert proc.returncode == 1
+    assert proc.stderr.count("[retry] executing:") == 1
+    assert "[retry] waiting for" not in proc.stderr
+    assert "[retry] giving up after 1 attempts: max time reached (0.1 seconds)" in proc.stderr
+
+
+def test_attempts_log_duration() -> None:
+    proc = run_retry("bash", HELPER_SCRIPT, "fail")
+    assert proc.returncode == 1
+    attempt_logs = re.findall(r"\[retry\] attempt \d finished in \S+ seconds", proc.stderr)
+    assert len(attempt_logs) == 3
+
+
+def process_is_running(pid: int) -> bool:
+    try:
+        stat = Path(f"/proc/{pid}/stat").read_text()
+    except FileNotFoundError:
+        if Path("/proc/self/stat").exists():
+            return False
+        # No /proc (e.g. on macOS)
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        return True
+    # A zombie is dead, it only waits for its parent (or init) to reap it. The state is
+    # the first field after the command name, which is in parentheses.
+    state = stat.rpartition(")")[2].split()[0]
+    return state != "Z"
+
+
+def assert_process_exits(pid: int, timeout: float = 5) -> None:
+    # Killing a process group is asynchronous, the process may still be exiting
+    deadline = time.monotonic() + timeout
+    while process_is_running(pid):
+        if time.monotonic() > deadline:
+            raise AssertionError(f"process {pid} is still running")
+        time.sleep(0.05)
+
+
+@pytest.mark.exclusive
+def test_attempt_timeout_kills_process_group(tmp_path: Path) -> None:
+    pid_file = tmp_path / "pid"
+
+    start_time = time.time()
+    proc = run_retry(
+        "bash",
+        HELPER_SCRIPT,
+        "hang",
+        pid_file,
+        env={"RETRY_ATTEMPT_TIMEOUT": "0.2", "RETRY_MAX_TRIES": "2"},
+    )
+    elapsed_time = time.time() - start_time
+
+    assert proc.returncode == 124
+    assert proc.stderr.count("[retry] executing:") == 2
+    assert re.search(r"\[retry\] attempt 1 timed out after 0\.2\d* seconds", proc.stderr)
+    assert re.search(r"\[retry\] attempt 2 timed out after 0\.2\d* seconds", proc.stderr)
+    assert "[retry] giving up after 2 attempts: max attempts reached" in proc.stderr
+    assert elapsed_time < 5
+
+    # The child process of the command got killed as well
+    assert_process_exits(int(pid_file.read_text()))
+
+
+def wait_for_file(path: Path, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not path.exists() or not path.read_text():
+        if time.monotonic() > deadline:
+            raise AssertionError(f"{path} didn't get written")
+        time.sleep(0.05)
+
+
+def test_attempt_timeout_forwards_sigterm(tmp_path: Path) -> None:
+    pid_file = tmp_path / "pid"
+
+    proc = subprocess.Popen(
+        ["bash", SCRIPT_FILE, "bash", HELPER_SCRIPT, "hang", pid_file],
+        env={"RETRY_ATTEMPT_TIMEOUT": "60"},
+        cwd=SCRIPT_DIR,
+        stderr=subprocess.DEVNULL,
+    )
+    wait_for_file(pid_file)
+    proc.terminate()
+
+    assert proc.wait(timeout=5) == 128 + signal.SIGTERM
+    # The command runs in its own process group, retry forwarded the signal to it
+    assert_process_exits(int(pid_file.read_text()))
+
+
+@pytest.mark.exclusive
+def test_attempt_timeout_sigkill() -> None:
+    start_time = time.time()
+    proc = run_retry(
+        "bash",
+        HELPER_SCRIPT,
+        "hang_ignoring_sigterm",
+        env={"RETRY_ATTEMPT_TIMEOUT": "0.2", "RETRY_KILL_AFTER": "0.2", "RETRY_MAX_TRIES": "1"},
+    )
+    elapsed_time = time.time() - start_time
+
+    assert proc.returncode == 124
+    assert "[retry] attempt 1 timed out after" in proc.stderr
+    assert elapsed_time < 5
+
+
+@pytest.mark.exclusive
+def test_attempt_timeout_then_succeed(tmp_path: Path) -> None:
+    state_file = tmp_path / "state"
+
+    proc = run_retry(
+        "bash",
+        HELPER_SCRIPT,
+        "hang_then_succeed",
+        state_file,
+        env={"RETRY_ATTEMPT_TIMEOUT": "0.5"},
+    )
+    assert proc.returncode == 0
+    assert "Success!" in proc.stdout
+    assert proc.stderr.count("[retry] executing:") == 2
+    assert "[retry] attempt 1 timed out after" in proc.stderr
+    assert "[retry] attempt 2 finished in" in proc.stderr
+
+
+@pytest.mark.exclusive
+def test_stop_on_timeout_exit_code() -> None:
+    proc = run_retry(
+        "bash",
+        HELPER_SCRIPT,
+        "hang_ignoring_sigterm",
+        env={
+            "RETRY_ATTEMPT_TIMEOUT": "0.2",
+            "RETRY_KILL_AFTER": "0.1",
+            "RETRY_STOP_ON_EXIT_CODES": "124",
+        },
+    )
+    assert proc.returncode == 124
+    assert proc.stderr.count("[retry] executing:") == 1
+    assert "[retry] giving up after 1 attempts: exit code is 124" in proc.stderr
+
+
+def process_tree(pid: int) -> list[int]:
+    """Get the pid and the pids of all the descendants of the process (from /proc)."""
+    children: dict[int, list[int]] = {}
+    for stat_file in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            stat = stat_file.read_text()
+        except OSError:
+            continue
+        # The command name (in parentheses) may contain spaces, the ppid is after the state
+        ppid = int(stat.rpartition(")")[2].split()[1])
+        children.setdefault(ppid, []).append(int(stat_file.parent.name))
+
+    tree = [pid]
+    for parent in tree:
+        tree.extend(children.get(parent, []))
+    return tree
+
+
+def peak_rss_kib(pid: int) -> int:
+    """Get the peak resident set size of the process (VmHWM from /proc), 0 if it's gone."""
+    try:
+        status = Path(f"/proc/{pid}/status").read_text()
+    except OSError:
+        return 0
+    match = re.search(r"^VmHWM:\s+(\d+) kB", status, re.MULTILINE)
+    return int(match.group(1)) if match else 0
+
+
+def test_large_stderr_uses_bounded_memory_and_disk(tmp_path: Path) -> None:
+    if not Path("/proc/self/status").exists():
+        pytest.skip("measuring the memory of the processes requires /proc")
+
+    tmpdir = tmp_path / "tmp"
+    tmpdir.mkdir()
+
+    def disk_usage() -> int:
+        return sum(
+            (Path(dirpath) / filename).stat().st_size
+            for dirpath, _, filenames in os.walk(tmpdir)
+            for filename in filenames
+        )
+
+    proc = subprocess.Popen(
+        ["bash", SCRIPT_FILE, "bash", HELPER_SCRIPT, "spam_stderr", "256"],
+        env={
+            "RETRY_BASE_DELAY": "0.001",
+            "RETRY_MAX_TRIES": "2",
+            "RETRY_STOP_IF_STDERR_MATCHES": "command failed",
+            "TMPDIR": str(tmpdir),
+        },
+        cwd=SCRIPT_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    assert proc.stderr is not None
+
+    stderr_size = 0
+    stderr_tail = b""
+    max_disk_usage = 0
+    max_rss_kib = 0
+    while chunk := proc.stderr.read(1024 * 1024):
+        stderr_size += len(chunk)
+        stderr_tail = (stderr_tail + chunk)[-1024:]
+        max_disk_usage = max(max_disk_usage, disk_usage())
+        # retry, the processes that read the stderr (tee, grep, awk) and the command itself
+        max_rss_kib = max([max_rss_kib, *map(peak_rss_kib, process_tree(proc.pid))])
+
+    assert proc.wait() == 1
+    # The whole stderr got passed through, the pattern on the last line got matched
+    assert stderr_size > 256 * 1024 * 1024
+    assert b"giving up after 1 attempts: stderr matches 'command failed'" in stderr_tail
+
+    assert max_disk_usage <= 8 * 1024
+    # The largest peak RSS of any of the processes, a tiny fraction of the stderr size
+    assert 0 < max_rss_kib < 32 * 1024
+
+
+# The throttling detection is opt-in, these are the patterns from the usage text
+THROTTLING = {
+    "RETRY_THROTTLE_IF_STDERR_MATCHES": "(^|[^0-9])429([^0-9]|$)|too many requests",
+    "RETRY_AFTER_PATTERN": 'retry[-_ ]?after[": =]*[0-9]+(\\.[0-9]+)?',
+}
+
+
+def test_throttled_attempts_wait_longer() -> None:
+    proc = run_retry(
+        "bash",
+        HELPER_SCRIPT,
+        "fail_with_stderr",
+        "429 Too Many Requests",
+        env=THROTTLING | {"RETRY_FACTOR": "1"},
+    )
+    assert proc.returncode == 1
+    assert "[retry] attempt 1 got throttled, increasing the wait time" in proc.stderr
+    # 0.001 * 4, 0.001 * 4
+    assert parse_waits(proc.stderr) == [0.004, 0.004]
+
+
+def test_custom_throttle_pattern() -> None:
+    proc = run_retry(
+        "bash",
+        HELPER_SCRIPT,
+        "fail_with_stderr",
+        "slow down",
+        env={
+            "RETRY_FACTOR": "1",
+            "RETRY_THROTTLE_IF_STDERR_MATCHES": "slow down",
+            "RETRY_THROTTLE_MULTIPLIER": "2.5",
+        },
+    )
+    assert proc.returncode == 1
+    assert parse_waits(proc.stderr) == [0.0025, 0.0025]
+
+
+def test_throttling_disabled_by_default() -> None:
+    proc = run_retry(
+        "bash",
+        HELPER_SCRIPT,
+        "fail_with_stderr",
+        "429 Too Many Requests, Retry-After: 10",
+        env={"RETRY_FACTOR": "1"},
+    )
+    assert proc.returncode == 1
+    assert "got throttled" not in proc.stderr
+    assert parse_waits(proc.stderr) == [0.001, 0.001]
+
+
+def test_throttle_pattern_ignores_other_numbers() -> None:
+    proc = run_retry(
+        "bash",
+        HELPER_SCRIPT,
+        "fail_with_stderr",
+        "blob sha256:4291f0e2 unknown, wrote 14290 bytes",
+        env=THROTTLING | {"RETRY_FACTOR": "1"},
+    )
+    assert proc.returncode == 1
+    assert "got throttled" not in proc.stderr
+    assert parse_waits(proc.stderr) == [0.001, 0.001]
+
+
+def test_retry_after_hint() -> None:
+    proc = run_retry(
+        "bash",
+        HELPER_SCRIPT,
+        "fail_with_stderr",
+        'too many requests, "Retry-After": "0.02"',
+        env=THROTTLING,
+    )
+    assert proc.returncode == 1
+    assert (
+        "[retry] attempt 1 got throttled, the suggested wait time is 0.02 seconds"
+        in proc.stderr
+    )
+    assert parse_waits(proc.stderr) == [0.02, 0.02]
+
+
+def test_retry_after_hint_capped_by_max_delay() -> None:
+    proc = run_retry(
+        "bash",
+        HELPER_SCRIPT,
+        "fail_with_stderr",
+        "retry after 120 seconds",
+        env=THROTTLING | {"RETRY_MAX_DELAY": "0.005"},
+    )
+    assert proc.returncode == 1
+    assert parse_waits(proc.stderr) == [0.005, 0.005]
+
+
+def test_retry_after_hint_capped_by_default() -> None:
+    proc = run_retry(
+        "bash",
+        HELPER_SCRIPT,
+        "fail_with_stderr",
+        "Retry-After: 86400",
+        env=THROTTLING | {"RETRY_VIRTUAL_TIME": "true"},
+    )
+    assert proc.returncode == 1
+    assert parse_waits(proc.stderr) == [300, 300]
+
+
+def test_retry_after_max_delay() -> None:
+    proc = run_retry(
+        "bash",
+        HELPER_SCRIPT,
+        "fail_with_stderr",
+        "retry after 120 seconds",
+        env=THROTTLING | {"RETRY_AFTER_MAX_DELAY": "0.005"},
+    )
+    assert proc.returncode == 1
+    assert parse_waits(proc.stderr) == [0.005, 0.005]
+
+
+@pytest.mark.exclusive
+def test_circuit_breaker_shared_between_processes(tmp_path: Path) -> None:
+    env = {
+        "RETRY_MAX_TRIES": "1",
+        "RETRY_STATE_DIR": str(tmp_path / "state"),
+        "RETRY_STATE_KEY": "quay.io",
+        "RETRY_BREAKER_THRESHOLD": "2",
+        "RETRY_BREAKER_COOLDOWN": "0.2",
+    }
+
+    proc = run_retry("bash", HELPER_SCRIPT, "fail", env=env)
+    assert proc.returncode == 1
+    assert "circuit breaker" not in proc.stderr
+
+    proc = run_retry("bash", HELPER_SCRIPT, "fail", env=env)
+    assert proc.returncode == 1
+    assert (
+        "[retry] 2 failed attempts in a row for 'quay.io', "
+        "opening the circuit breaker for 0.2 seconds"
+    ) in proc.stderr
+
+    # Another process waits for the breaker to close before the first attempt
+    start = time.monotonic()
+    proc = run_retry("bash", HELPER_SCRIPT, "succeed", env=env)
+    assert proc.returncode == 0
+    assert "[retry] the circuit breaker for 'quay.io' is open" in proc.stderr
+    assert len(parse_waits(proc.stderr)) == 1
+    assert time.monotonic() - start >= 0.1
+
+    # The success closed the breaker
+    proc = run_retry("bash", HELPER_SCRIPT, "succeed", env=env)
+    assert proc.returncode == 0
+    assert "circuit breaker" not in proc.stderr
+
+
+@pytest.mark.exclusive
+def test_circuit_breaker_half_open_single_trial(tmp_path: Path) -> None:
+    env = {
+        "RETRY_MAX_TRIES": "1",
+        "RETRY_STATE_DIR": str(tmp_path / "state"),
+        "RETRY_BREAKER_THRESHOLD": "1",
+        "RETRY_BREAKER_COOLDOWN": "1",
+    }
+    proc = run_retry("bash", HELPER_SCRIPT, "fail", env=env)
+    assert "opening the circuit breaker" in proc.stderr
+
+    # Both processes wait for the cooldown, then only one of them makes the trial attempt.
+    # The other one starts only after the trial succeeded and closed the breaker.
+    log_file = tmp_path / "log"
+    cmd = f"echo start >> {log_file}; sleep 0.3; echo end >> {log_file}"
+    procs = [
+        subprocess.Popen(
+            ["bash", SCRIPT_FILE, "bash", "-c", cmd],
+            env=env,
+            cwd=SCRIPT_DIR,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        for _ in range(2)
+    ]
+    results = [proc.communicate(timeout=10) for proc in procs]
+
+    assert [proc.returncode for proc in procs] == [0, 0]
+    assert log_file.read_text().split() == ["start", "end", "start", "end"]
+    stderrs = [stderr for _, stderr in results]
+    assert sum("making a trial attempt" in stderr for stderr in stderrs) == 1
+
+
+def test_circuit_breaker_keys_are_independent(tmp_path: Path) -> None:
+    env = {
+        "RETRY_MAX_TRIES": "1",
+        "RETRY_STATE_DIR": str(tmp_path / "state"),
+        "RETRY_BREAKER_THRESHOLD": "1",
+        "RETRY_BREAKER_COOLDOWN": "60",
+    }
+
+    proc = run_retry("bash", HELPER_SCRIPT, "fail", env=env | {"RETRY_STATE_KEY": "quay.io"})
+    assert "opening the circuit breaker" in proc.stderr
+
+    proc = run_retry("bash", HELPER_SCRIPT, "succeed", env=env | {"RETRY_STATE_KEY": "ghcr.io"})
+    assert proc.returncode == 0
+    assert "circuit breaker" not in proc.stderr
+
+
+def test_circuit_breaker_open_longer_than_max_time(tmp_path: Path) -> None:
+    env = {
+        "RETRY_MAX_TRIES": "1",
+        "RETRY_STATE_DIR": str(tmp_path / "state"),
+        "RETRY_BREAKER_THRESHOLD": "1",
+        "RETRY_BREAKER_COOLDOWN": "60",
+    }
+    run_retry("bash", HELPER_SCRIPT, "fail", env=env)
+
+    proc = run_retry("bash", HELPER_SCRIPT, "succeed", env=env | {"RETRY_MAX_TIME": "1"})
+    assert proc.returncode == 1
+    assert "Success!" not in proc.stdout
+    assert "[retry] giving up after 0 attempts: max time reached (1 seconds)" in proc.stderr
+
+
+def test_circuit_breaker_ignores_stop_rules(tmp_path: Path) -> None:
+    env = {
+        "RETRY_STATE_DIR": str(tmp_path / "state"),
+        "RETRY_BREAKER_THRESHOLD": "1",
+        "RETRY_STOP_ON_EXIT_CODES": "42",
+    }
+    # Failures that don't get retried don't say anything about the health of the service
+    proc = run_retry("bash", HELPER_SCRIPT, "fail_with_code", "42", env=env)
+    assert proc.returncode == 42
+    assert "circuit breaker" not in proc.stderr
+
+
+def test_metrics_file(tmp_path: Path) -> None:
+    metrics_file = tmp_path / "metrics.jsonl"
+    state_file = tmp_path / "state"
+    env = {"RETRY_METRICS_FILE": str(metrics_file)}
+
+    run_retry("bash", HELPER_SCRIPT, "fail_then_succeed", "1", state_file, env=env)
+    run_retry("bash", HELPER_SCRIPT, "fail_with_stderr", 'quote " and\ttab', env=env)
+
+    records = [json.loads(line) for line in metrics_file.read_text().splitlines()]
+    assert len(records) == 2
+
+    success, failure = records
+    assert success["command"] == [
+        "bash",
+        str(HELPER_SCRIPT),
+        "fail_then_succeed",
+        "1",
+        str(state_file),
+    ]
+    assert success["exit_code"] == 0
+    assert success["stop_reason"] == "success"
+    assert [attempt["exit_code"] for attempt in success["attempts"]] == [1, 0]
+    assert not any(attempt["timed_out"] for attempt in success["attempts"])
+    assert success["total_sleep"] == 0.001
+    assert success["total_time"] >= sum(attempt["duration"] for attempt in success["attempts"])
+    assert success["start_time"] <= time.time()
+
+    assert failure["command"][-1] == 'quote " and\ttab'
+    assert failure["exit_code"] == 1
+    assert failure["stop_reason"] == "max_tries"
+    assert len(failure["attempts"]) == 3
+    # 0.001 + 0.002
+    assert failure["total_sleep"] == 0.003
+
+
+@pytest.mark.exclusive
+def test_metrics_stop_reasons(tmp_path: Path) -> None:
+    metrics_file = tmp_path / "metrics.jsonl"
+    env = {"RETRY_METRICS_FILE": str(metrics_file)}
+
+    run_retry(
+        "bash", HELPER_SCRIPT, "fail_with_code", "2", env=env | {"RETRY_STOP_ON_EXIT_CODES": "2"}
+    )
+    run_retry(
+        "bash",
+        HELPER_SCRIPT,
+        "fail_with_stderr",
+        "unauthorized",
+        env=env | {"RETRY_STOP_IF_STDERR_MATCHES": "unauthorized"},
+    )
+    run_retry(
+        "bash",
+        HELPER_SCRIPT,
+        "fail",
+        env=env | {"RETRY_BASE_DELAY": "10", "RETRY_MAX_TIME": "1"},
+    )
+    run_retry(
+        "bash",
+        HELPER_SCRIPT,
+        "hang_then_succeed",
+        tmp_path / "hang-state",
+        env=env | {"RETRY_ATTEMPT_TIMEOUT": "0.2"},
+    )
+
+    records = [json.loads(line) for line in metrics_file.read_text().splitlines()]
+    assert [(record["stop_reason"], record["exit_code"]) for record in records] == [
+        ("exit_code", 2),
+        ("stderr_matches", 1),
+        ("max_time", 1),
+        ("success", 0),
+    ]
+    assert [attempt["timed_out"] for attempt in records[3]["attempts"]] == [True, False]
+    assert records[3]["attempts"][0]["exit_code"] == 124
+
+
+def run_retry_batch(
+    commands: str, env: dict[str, str] | None = None
+) -> subprocess.CompletedProcess[str]:
+    """Run the retry script in batch mode, passing the commands on stdin."""
+    default_env = {"RETRY_BASE_DELAY": "0.001", "RETRY_MAX_TRIES": "3"}
+    if env:
+        default_env.update(env)
+
+    return subprocess.run(
+        ["bash", SCRIPT_FILE, "--batch"],
+        env=default_env,
+        cwd=SCRIPT_DIR,
+        input=commands,
+        capture_output=True,
+        text=True,
+    )
+
+
+def test_batch_collect_all(tmp_path: Path) -> None:
+    commands_file = tmp_path / "commands.txt"
+    commands_file.write_text(
+        "\n".join(
+            [
+                "# copy the images",
+                "echo first",
+                "",
+                f"bash {HELPER_SCRIPT} fail_with_code 7",
+                "echo third",
+            ]
+        )
+    )
+    proc = run_retry("--batch", commands_file)
+    assert proc.returncode == 7
+    assert "first" in proc.stdout
+    assert "third" in proc.stdout
+    # The failing command gets retried as usual
+    assert proc.stderr.count("[retry #2] executing:") == 3
+    assert re.search(r"\[retry\]   #1 succeeded in [\d.]+ seconds: echo first", proc.stderr)
+    assert re.search(
+        r"\[retry\]   #2 failed in [\d.]+ seconds with exit code 7: bash .* fail_with_code 7",
+        proc.stderr,
+    )
+    assert re.search(r"\[retry\]   #3 succeeded in [\d.]+ seconds: echo third", proc.stderr)
+    assert "[retry] 2 succeeded, 1 failed, 0 skipped" in proc.stderr
+
+
+def test_batch_follows_stop_rules() -> None:
+    proc = run_retry_batch(
+        "exit 0\nexit 2\n",
+        env={"RETRY_STOP_ON_EXIT_CODES": "2"},
+    )
+    assert proc.returncode == 2
+    assert proc.stderr.count("[retry #2] executing:") == 1
+    assert "[retry #2] giving up after 1 attempts: exit code is 2" in proc.stderr
+
+
+def test_batch_exit_code_follows_the_file_order() -> None:
+    # #2 fails first, but #1 comes first in the file
+    proc = run_retry_batch(
+        "sleep 0.2; exit 3\nexit 4\n",
+        env={"RETRY_BATCH_CONCURRENCY": "2", "RETRY_MAX_TRIES": "1"},
+    )
+    assert proc.returncode == 3
+
+
+def test_batch_runs_commands_concurrently(tmp_path: Path) -> None:
+    # Each command waits for the other one, would time out if they didn't run concurrently
+    wait_for = 'touch {}; for _ in $(seq 200); do [ -e {} ] && exit 0; sleep 0.01; done; exit 1'
+    commands = [
+        wait_for.format(tmp_path / "a", tmp_path / "b"),
+        wait_for.format(tmp_path / "b", tmp_path / "a"),
+    ]
+    proc = run_retry_batch("\n".join(commands), env={"RETRY_MAX_TRIES": "1"})
+    assert proc.returncode == 0, proc.stderr
+
+
+def test_batch_concurrency_limit(tmp_path: Path) -> None:
+    running_dir = tmp_path / "running"
+    running_dir.mkdir()
+    counts_file = tmp_path / "counts"
+
+    commands = [
+        f"touch {running_dir}/{i}; ls {running_dir} | wc -l >> {counts_file}; "
+        f"sleep 0.1; rm {running_dir}/{i}"
+        for i in range(6)
+    ]
+    proc = run_retry_batch("\n".join(commands), env={"RETRY_BATCH_CONCURRENCY": "2"})
+    assert proc.returncode == 0, proc.stderr
+
+    counts = [int(count) for count in counts_file.read_text().split()]
+    assert len(counts) == 6
+    assert max(counts) <= 2
+
+
+@pytest.mark.exclusive
+def test_batch_fail_fast() -> None:
+    proc = run_retry_batch(
+        "sleep 0.2; exit 3\nexit 1\necho never\n",
+        env={"RETRY_BATCH_CONCURRENCY": "2", "RETRY_BATCH_FAIL_FAST": "true"},
+    )
+    # The exit code of the first failed command in the file, even though #2 failed first
+    assert proc.returncode == 3
+    assert "never" not in proc.stdout
+    assert "[retry] #2 failed, cancelling the batch" in proc.stderr
+    # The running command stops retrying
+    assert (
+        "[retry #1] giving up after 1 attempts: another command in the batch failed"
+        in proc.stderr
+    )
+    assert "[retry]   #3 skipped: echo never" in proc.stderr
+    assert "[retry] 0 succeeded, 2 failed, 1 skipped" in proc.stderr
+
+
+def test_batch_invalid_config() -> None:
+    proc = run_retry_batch("true\n", env={"RETRY_BATCH_CONCURRENCY": "0"})
+    assert proc.returncode == 1
+    assert "RETRY_BATCH_CONCURRENCY must be at least 1" in proc.stderr
+
+
+@pytest.mark.exclusive
+def test_hedged_attempt(tmp_path: Path) -> None:
+    pid_file = tmp_path / "pid"
+
+    start_time = time.time()
+    proc = run_retry(
+        "bash",
+        HELPER_SCRIPT,
+        "hang_with_output_then_succeed",
+        tmp_path / "state",
+        pid_file,
+        env={"RETRY_HEDGE_AFTER": "0.2"},
+    )
+    elapsed_time = time.time() - start_time
+
+    assert proc.returncode == 0
+    # Only the output of the winner
+    assert proc.stdout == "Success!\n"
+    assert proc.stderr.count("[retry] executing:") == 1
+    assert "[retry] copy 1 is still running after 0.2 seconds, starting copy 2" in proc.stderr
+    assert "[retry] copy 2 succeeded, stopping the other copies" in proc.stderr
+    assert elapsed_time < 5
+
+    # The losing copy got killed, including its child process
+    assert_process_exits(int(pid_file.read_text()))
+
+
+def test_hedged_attempt_forwards_sigterm(tmp_path: Path) -> None:
+    pid_file = tmp_path / "pids"
+
+    proc = subprocess.Popen(
+        ["bash", SCRIPT_FILE, "bash", "-c", f"sleep 60 & echo $! >> {pid_file}; wait"],
+        env={"RETRY_HEDGE_AFTER": "0.1"},
+        cwd=SCRIPT_DIR,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 5
+    while not pid_file.exists() or len(pid_file.read_text().splitlines()) < 2:
+        assert time.monotonic() < deadline, "the hedged copy didn't start"
+        time.sleep(0.05)
+    proc.terminate()
+
+    assert proc.wait(timeout=5) == 128 + signal.SIGTERM
+    # Both copies got the signal, including their child processes
+    for pid in pid_file.read_text().split():
+        assert_process_exits(int(pid))
+
+
+@pytest.mark.exclusive
+def test_hedged_attempt_max_hedges() -> None:
+    proc = run_retry(
+        "bash",
+        "-c",
+        "sleep 0.5; echo $$; exit 5",
+        env={"RETRY_HEDGE_AFTER": "0.1", "RETRY_MAX_HEDGES": "2", "RETRY_MAX_TRIES": "1"},
+    )
+    # All the copies failed, the attempt failed
+    assert proc.returncode == 5
+    assert "starting copy 2" in proc.stderr
+    assert "starting copy 3" in proc.stderr
+    assert "starting copy 4" not in proc.stderr
+    # The output of the last copy that failed
+    assert len(proc.stdout.splitlines()) == 1
+
+
+@pytest.mark.exclusive
+def test_hedged_attempt_timeout() -> None:
+    start_time = time.time()
+    proc = run_retry(
+        "bash",
+        HELPER_SCRIPT,
+        "hang_ignoring_sigterm",
+        env={
+            "RETRY_HEDGE_AFTER": "0.1",
+            "RETRY_ATTEMPT_TIMEOUT": "0.3",
+            "RETRY_KILL_AFTER": "0.2",
+            "RETRY_MAX_TRIES": "1",
+        },
+    )
+    elapsed_time = time.time() - start_time
+
+    assert proc.returncode == 124
+    assert "starting copy 2" in proc.stderr
+    assert "[retry] attempt 1 timed out after" in proc.stderr
+    assert elapsed_time < 5
+
+
+# Don't really wait between attempts, see RETRY_VIRTUAL_TIME
+VIRTUAL_TIME = {"RETRY_VIRTUAL_TIME": "true", "RETRY_BASE_DELAY": "1"}
+
+
+@pytest.mark.exclusive
+def test_virtual_time_default_schedule() -> None:
+    start_time = time.time()
+    proc = run_retry("bash", HELPER_SCRIPT, "fail", env=VIRTUAL_TIME | {"RETRY_MAX_TRIES": "10"})
+    elapsed_time = time.time() - start_time
+
+    assert proc.returncode == 1
+    assert proc.stderr.count("[retry] executing:") == 10
+    assert parse_waits(proc.stderr) == [1, 2, 4, 8, 16, 32, 64, 128, 256]
+    # Instead of 511 seconds
+    assert elapsed_time < 5
+
+
+def test_virtual_time_max_time() -> None:
+    proc = run_retry(
+        "bash",
+        HELPER_SCRIPT,
+        "fail",
+        env=VIRTUAL_TIME | {"RETRY_MAX_TRIES": "10", "RETRY_MAX_TIME": "60"},
+    )
+    assert proc.returncode == 1
+    # 1 + 2 + 4 + 8 + 16 = 31, waiting another 32 seconds would take more than 60 seconds
+    assert parse_waits(proc.stderr) == [1, 2, 4, 8, 16]
+    assert "[retry] giving up after 6 attempts: max time reached (60 seconds)" in proc.stderr
+
+
+def test_virtual_time_max_delay_and_throttling() -> None:
+    proc = run_retry(
+        "bash",
+        HELPER_SCRIPT,
+        "fail_with_stderr",
+        "HTTP 429 Too Many Requests",
+        env=VIRTUAL_TIME
+        | THROTTLING
+        | {"RETRY_MAX_TRIES": "10", "RETRY_FACTOR": "3", "RETRY_MAX_DELAY": "300"},
+    )
+    assert proc.returncode == 1
+    # 1, 3, 9, 27, 81, 243, 729, ... times 4, capped at 300
+    assert parse_waits(proc.stderr) == [4, 12, 36, 108, 300, 300, 300, 300, 300]
+
+
+def test_virtual_time_decorrelated_jitter() -> None:
+    proc = run_retry(
+        "bash",
+        HELPER_SCRIPT,
+        "fail",
+        env=VIRTUAL_TIME
+        | {"RETRY_MAX_TRIES": "50", "RETRY_JITTER": "decorrelated", "RETRY_MAX_DELAY": "60"},
+    )
+    assert proc.returncode == 1
+
+    waits = parse_waits(proc.stderr)
+    assert len(waits) == 49
+    previous_wait = 1.0
+    for wait in waits:
+        assert 1 <= wait <= min(previous_wait * 3, 60) * 1.0001
+        previous_wait = wait
+
+
+def test_virtual_time_metrics(tmp_path: Path) -> None:
+    metrics_file = tmp_path / "metrics.jsonl"
+    run_retry(
+        "bash",
+        HELPER_SCRIPT,
+        "fail",
+        env=VIRTUAL_TIME | {"RETRY_MAX_TRIES": "10", "RETRY_METRICS_FILE": str(metrics_file)},
+    )
+
+    record = json.loads(metrics_file.read_text())
+    assert record["total_sleep"] == 511
+    assert 511 <= record["total_time"] < 516
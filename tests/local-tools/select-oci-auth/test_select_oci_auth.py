@@ -74,6 +74,7 @@ def test_print_usage():
         ["reg.io", '{"auths": {"reg.io": {"auth": "reg.io secret"}}}'],
         ["reg.io/foo", '{"auths": {"reg.io": {"auth": "reg.io secret"}}}'],
         ["reg.io/foo/bar", '{"auths": {"reg.io": {"auth": "reg.io/foo/bar secret"}}}'],
+        ["reg.io/foo/bar/baz/qux:1.0", '{"auths": {"reg.io": {"auth": "reg.io/foo/bar secret"}}}'],
         ["new-reg.io/cool-app", '{"auths": {}}'],
         ["arbitrary-input", '{"auths": {}}'],
     ],
@@ -1,16 +1,18 @@
 import json
+import os
 import platform
-import subprocess
 from pathlib import Path
 from textwrap import dedent
 
 import pytest
 
 from tests.utils.container import Container
+from tests.utils.oci_cache import cached_oci_layout, default_cache_dir, link_tree
 
 
 @pytest.fixture(scope="module")
 def context_dir(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    # With pytest-xdist, each worker has its own basetemp => its own context directory
     contextdir = tmp_path_factory.mktemp("buildcontext")
     # We're going to mount this directory into the container image, which runs as
     # a non-root user. Allow that user to read this directory.
@@ -18,21 +20,14 @@ def context_dir(tmp_path_factory: pytest.TempPathFactory) -> Path:
 
     base_image = "registry.access.redhat.com/ubi10/ubi-micro@sha256:2946fa1b951addbcd548ef59193dc0af9b3e9fedb0287b4ddb6e697b06581622"
 
-    # Pre-pull the base image and make it available as an oci archive in the context directory
-    # (so that each test doesn't have to re-pull the base image; this speeds up tests)
-    subprocess.run(
-        [
-            "skopeo",
-            "copy",
-            # For the Mac users out there (they *can* build from a linux image,
-            # but we have to explicitly tell skopeo to not try to pull a macos image)
-            "--override-os=linux",
-            "--remove-signatures",
-            f"docker://{base_image}",
-            f"oci:{contextdir / 'base_image'}",
-        ],
-        check=True,
+    # Make the base image available as an OCI layout in the context directory (so that each
+    # test doesn't have to re-pull the base image; this speeds up tests). The layout comes
+    # from a persistent cache, the base image only gets fetched once per digest.
+    archive = os.getenv("TEST_BASE_IMAGE_ARCHIVE")
+    layout_dir = cached_oci_layout(
+        base_image, default_cache_dir(), archive=Path(archive) if archive else None
     )
+    link_tree(layout_dir, contextdir / "base_image")
 
     contextdir.joinpath("Containerfile").write_text(
         dedent(
@@ -75,6 +70,7 @@ def test_buildah_uses_native_overlay_as_root(task_runner_container: Container) -
     assert "Unable to create kernel-style whiteout: operation not permitted" not in proc.stderr
 
 
+@pytest.mark.exclusive
 @pytest.mark.parametrize("user", ["taskuser", "root"])
 @pytest.mark.skipif(
     platform.system() == "Darwin",
@@ -97,7 +93,10 @@ def test_buildah_falls_back_to_fuse_overlayfs(user: str, task_runner_container:
 
 @pytest.mark.parametrize(
     "use_native_overlay",
-    [pytest.param(True, id="native_overlay"), pytest.param(False, id="fuse_overlayfs")],
+    [
+        pytest.param(True, id="native_overlay"),
+        pytest.param(False, id="fuse_overlayfs", marks=pytest.mark.exclusive),
+    ],
 )
 def test_buildah_build_works(
     use_native_overlay: bool, task_runner_container: Container, context_dir: Path
@@ -121,7 +120,10 @@ def test_buildah_build_works(
 
 @pytest.mark.parametrize(
     "use_native_overlay",
-    [pytest.param(True, id="native_overlay"), pytest.param(False, id="fuse_overlayfs")],
+    [
+        pytest.param(True, id="native_overlay"),
+        pytest.param(False, id="fuse_overlayfs", marks=pytest.mark.exclusive),
+    ],
 )
 def test_buildah_build_works_as_root(
     use_native_overlay: bool, task_runner_container: Container, context_dir: Path
@@ -144,6 +146,7 @@ def test_buildah_build_works_as_root(
     )
 
 
+@pytest.mark.exclusive
 @pytest.mark.parametrize("isolation", ["rootless", "oci"])
 def test_buildah_can_use_stronger_isolation(
     isolation: str, task_runner_container: Container, context_dir: Path
@@ -159,6 +162,7 @@ def test_buildah_can_use_stronger_isolation(
     )
 
 
+@pytest.mark.exclusive
 @pytest.mark.parametrize("isolation", ["rootless", "oci"])
 def test_buildah_can_use_stronger_isolation_as_root(
     isolation: str, task_runner_container: Container, context_dir: Path
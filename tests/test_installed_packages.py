@@ -1,50 +1,58 @@
+import shlex
+import subprocess
+
 import pytest
 
+from devtool.executables import executable_name, version_command
+from devtool.image_versions import read_image_versions, verify_versions
 from devtool.software_list import Package, list_packages
 from tests.constants import REPO_ROOT
 from tests.utils.container import Container
 
-package_name_to_executable_name = {
-    "coreutils-single": "coreutils",
-    "git-core": "git",
-    "findutils": "find",
-    "gawk": "awk",
-    "gettext-envsubst": "envsubst",
-    "awscli": "aws",
-}
-
-# overrides for tools that don't support a simple --version flag
-version_arg_overrides = {
-    "tkn": ["version", "--component", "client"],
-    "cosign": ["version"],
-    "oras": ["version"],
-    "kubectl": ["version", "--client"],
-    "oc": ["version", "--client"],
-}
-
 expected_packages = list_packages(REPO_ROOT)
 packages_param = [pytest.param(package, id=package.name) for package in expected_packages]
 
 
+@pytest.fixture(scope="module")
+def probe_results(
+    task_runner_container: Container,
+) -> dict[str, subprocess.CompletedProcess[str]]:
+    """Run the commands for all the tests below in a single container, in one go."""
+    cmds: dict[str, list[str]] = {}
+    for package in expected_packages:
+        cmds[f"{package.name}:installed"] = ["command", "-v", executable_name(package)]
+        if version_cmd := version_command(package):
+            cmds[f"{package.name}:version"] = version_cmd
+
+    return task_runner_container.run_cmds_batched(cmds)
+
+
+def assert_succeeded(proc: subprocess.CompletedProcess[str]) -> None:
+    # The probes run in a module-scoped fixture, their logs don't show up in the failed test
+    assert proc.returncode == 0, (
+        f"{shlex.join(proc.args)} failed with exit code {proc.returncode}\n"
+        f"stdout>\n{proc.stdout}\nstderr>\n{proc.stderr}"
+    )
+
+
 @pytest.mark.parametrize("package", packages_param)
-def test_package_is_installed(package: Package, task_runner_container: Container) -> None:
-    executable_name = package_name_to_executable_name.get(package.name, package.name)
-    task_runner_container.run_cmd(["command", "-v", executable_name])
+def test_package_is_installed(
+    package: Package, probe_results: dict[str, subprocess.CompletedProcess[str]]
+) -> None:
+    assert_succeeded(probe_results[f"{package.name}:installed"])
 
 
 @pytest.mark.parametrize("package", packages_param)
 def test_package_returns_correct_version(
-    package: Package, task_runner_container: Container
+    package: Package, probe_results: dict[str, subprocess.CompletedProcess[str]]
 ) -> None:
-    executable_name = package_name_to_executable_name.get(package.name, package.name)
-
-    if executable_name == "microdnf":
-        pytest.skip("microdnf doesn't have a version flag")
+    if version_command(package) is None:
+        pytest.skip(f"{executable_name(package)} doesn't have a version flag")
 
-    version_args = version_arg_overrides.get(executable_name, ["--version"])
-    proc = task_runner_container.run_cmd([executable_name, *version_args])
+    proc = probe_results[f"{package.name}:version"]
+    assert_succeeded(proc)
 
-    if executable_name == "jq":
+    if executable_name(package) == "jq":
         pytest.xfail("jq from the RPM doesn't currently return a correct version string")
 
     # drop the release part from RPM versions
@@ -54,3 +62,9 @@ def test_package_returns_correct_version(
         assert expect_version in proc.stdout
     else:
         assert expect_version in proc.stderr
+
+
+def test_embedded_versions_match(task_runner_container: Container) -> None:
+    # Doesn't execute the tools, reads the Go build info, rpmdb etc. from the filesystem
+    versions = read_image_versions(task_runner_container.image_name)
+    assert verify_versions(expected_packages, versions) == []
@@ -0,0 +1,47 @@
+import logging
+import os
+
+import pytest
+
+from tests.utils.container import Container
+
+log = logging.getLogger(__name__)
+
+# Generous enough to not be flaky on slow CI runners, strict enough to catch an update
+# that makes 'aws' import significantly more modules (or lose its pre-compiled bytecode).
+AWS_COLD_START_THRESHOLD_MS = int(os.getenv("AWS_COLD_START_THRESHOLD_MS", "3000"))
+
+SITE_PACKAGES_CMD = (
+    "python3 -c 'import sysconfig; "
+    'print(sysconfig.get_path("purelib"), sysconfig.get_path("platlib"))\''
+)
+
+
+def test_pip_packages_have_precompiled_bytecode(task_runner_container: Container) -> None:
+    # As the non-root user, compileall can't write to site-packages. It only succeeds if
+    # there is nothing left to compile, i.e. if the image build compiled everything.
+    task_runner_container.run_cmd(
+        [
+            "bash",
+            "-c",
+            f"{SITE_PACKAGES_CMD} | xargs python3 -m compileall -q -o 0 -o 1 -o 2",
+        ],
+    )
+
+
+@pytest.mark.exclusive
+def test_aws_cold_start_latency(task_runner_container: Container) -> None:
+    # Measure inside the container to exclude the container startup overhead
+    proc = task_runner_container.run_cmd(
+        [
+            "bash",
+            "-c",
+            # A failing 'aws' must fail the test, not pass it for being fast
+            "start=$(date +%s%N) && aws --version >/dev/null && end=$(date +%s%N) && "
+            "echo $(( (end - start) / 1000000 ))",
+        ],
+    )
+    elapsed_ms = int(proc.stdout.strip())
+    log.info("aws --version cold start: %d ms", elapsed_ms)
+
+    assert elapsed_ms < AWS_COLD_START_THRESHOLD_MS
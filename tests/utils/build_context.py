@@ -0,0 +1,118 @@
+import fnmatch
+import hashlib
+import os
+import subprocess
+from pathlib import Path
+
+
+def build_context_hash(context_dir: Path, containerfile: str = "Containerfile") -> str:
+    """Compute a hash of everything in the build context that can affect the built image.
+
+    Honors the .containerignore file. Doesn't hash the contents of git submodules (that
+    would be slow for large ones like kubernetes), uses their HEAD commit and their
+    uncommitted changes instead. For the same reason, skips the .git directory of the
+    repo itself (the build only uses it to get the submodule tags).
+    """
+    ignore_patterns = _read_ignore_patterns(context_dir / ".containerignore")
+    digest = hashlib.sha256()
+
+    digest.update(containerfile.encode() + b"\0")
+    digest.update(context_dir.joinpath(containerfile).read_bytes())
+
+    for dirpath, dirnames, filenames in os.walk(context_dir):
+        current_dir = Path(dirpath)
+        dirnames.sort()
+
+        for dirname in list(dirnames):
+            relpath = current_dir.joinpath(dirname).relative_to(context_dir).as_posix()
+            subdir = current_dir / dirname
+
+            if dirname == ".git":
+                dirnames.remove(dirname)
+            elif _is_ignored(relpath, ignore_patterns):
+                # A later !pattern may still include some of the files in the directory
+                if not _may_include_children(relpath, ignore_patterns):
+                    dirnames.remove(dirname)
+            elif subdir.joinpath(".git").exists():
+                dirnames.remove(dirname)
+                digest.update(relpath.encode() + b"\0")
+                digest.update(_submodule_state(subdir))
+
+        for filename in sorted(filenames):
+            path = current_dir / filename
+            relpath = path.relative_to(context_dir).as_posix()
+            if _is_ignored(relpath, ignore_patterns) or not path.is_file():
+                continue
+
+            digest.update(relpath.encode() + b"\0")
+            digest.update(f"{path.stat().st_mode & 0o777:o}\0".encode())
+            digest.update(path.read_bytes())
+
+    return digest.hexdigest()
+
+
+def _read_ignore_patterns(ignore_file: Path) -> list[tuple[str, bool]]:
+    """Read the patterns as (pattern, is_exclusion) tuples, in order."""
+    if not ignore_file.exists():
+        return []
+
+    patterns: list[tuple[str, bool]] = []
+    for line in ignore_file.read_text().splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        is_exclusion = not line.startswith("!")
+        pattern = line.removeprefix("!").strip("/")
+        patterns.append((pattern, is_exclusion))
+
+    return patterns
+
+
+def _is_ignored(relpath: str, patterns: list[tuple[str, bool]]) -> bool:
+    # Like in .dockerignore, the last matching pattern wins. A pattern matches a path
+    # if it matches the path itself or any of its parent directories.
+    parts = relpath.split("/")
+    prefixes = ["/".join(parts[: i + 1]) for i in range(len(parts))]
+
+    ignored = False
+    for pattern, is_exclusion in patterns:
+        if "**" in pattern:
+            candidates = prefixes
+        else:
+            # Wildcards don't match across directories, compare the same number of segments
+            n_segments = pattern.count("/") + 1
+            candidates = prefixes[n_segments - 1 : n_segments]
+
+        if any(fnmatch.fnmatchcase(prefix, pattern.replace("**", "*")) for prefix in candidates):
+            ignored = is_exclusion
+
+    return ignored
+
+
+def _may_include_children(relpath: str, patterns: list[tuple[str, bool]]) -> bool:
+    # Whether any !pattern could match a path inside the directory
+    parts = relpath.split("/")
+    for pattern, is_exclusion in patterns:
+        if is_exclusion:
+            continue
+        if "**" in pattern:
+            return True
+
+        pattern_parts = pattern.split("/")
+        if len(pattern_parts) > len(parts) and all(
+            fnmatch.fnmatchcase(part, pattern_part)
+            for part, pattern_part in zip(parts, pattern_parts)
+        ):
+            return True
+
+    return False
+
+
+def _submodule_state(submodule_dir: Path) -> bytes:
+    def git(*args: str) -> bytes:
+        return subprocess.run(
+            ["git", *args], stdout=subprocess.PIPE, check=True, cwd=submodule_dir
+        ).stdout
+
+    return git("rev-parse", "HEAD") + git("tag", "--points-at=HEAD") + git("diff", "HEAD")
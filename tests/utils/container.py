@@ -1,16 +1,41 @@
+import contextlib
+import json
 import logging
 import os
 import shlex
 import subprocess
+import time
 from pathlib import Path
-from typing import Self, Sequence
+from typing import Iterator, Mapping, Self, Sequence
+
+from tests.utils.timing import recorder
 
 log = logging.getLogger(__name__)
 
+# Runs each command from the JSON object in argv[1] ({key: [cmd, *args]}), prints
+# a JSON object with the results ({key: {"returncode", "stdout", "stderr", "wall_time"}})
+_BATCH_SCRIPT = """
+import json, subprocess, sys, time
+
+results = {}
+for key, cmd in json.loads(sys.argv[1]).items():
+    start = time.monotonic()
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        result = {"returncode": proc.returncode, "stdout": proc.stdout, "stderr": proc.stderr}
+    except OSError as e:
+        result = {"returncode": 127, "stdout": "", "stderr": str(e)}
+    result["wall_time"] = time.monotonic() - start
+    results[key] = result
+
+json.dump(results, sys.stdout)
+"""
+
 
 class Container:
     def __init__(self, image_name: str) -> None:
         self._image_name = image_name
+        self._session_id: str | None = None
 
     @property
     def image_name(self) -> str:
@@ -18,11 +43,67 @@ class Container:
 
     @classmethod
     def build_image(cls, context_dir: Path, image_name: str) -> Self:
-        subprocess.run(
-            ["podman", "build", "--tag", image_name, context_dir],
+        podman_cmd = ["podman", "build", "--tag", image_name, str(context_dir)]
+        start = time.monotonic()
+        proc = subprocess.run(podman_cmd)
+        recorder.record("build", podman_cmd, [], time.monotonic() - start, proc.returncode)
+        proc.check_returncode()
+        return cls(image_name)
+
+    @staticmethod
+    def image_exists(image_name: str) -> bool:
+        proc = subprocess.run(["podman", "image", "exists", image_name])
+        return proc.returncode == 0
+
+    @staticmethod
+    def list_images(reference: str) -> list[str]:
+        """List the names of the local images that match the reference (may have wildcards)."""
+        proc = subprocess.run(
+            [
+                "podman",
+                "images",
+                f"--filter=reference={reference}",
+                "--format={{.Repository}}:{{.Tag}}",
+            ],
+            stdout=subprocess.PIPE,
+            text=True,
             check=True,
         )
-        return cls(image_name)
+        return proc.stdout.split()
+
+    @staticmethod
+    def remove_image(image_name: str) -> bool:
+        """Remove the image (or only the tag). Return False if that failed, e.g. it's in use."""
+        proc = subprocess.run(["podman", "rmi", image_name], stdout=subprocess.DEVNULL)
+        return proc.returncode == 0
+
+    @contextlib.contextmanager
+    def session(self) -> Iterator[Self]:
+        """Keep a long-lived container running, run commands in it with podman exec.
+
+        While the session is active, run_cmd() executes commands in the session container
+        instead of starting a fresh container for each one (saves the container startup
+        overhead). Commands that need distinct volumes, devices, users, capabilities or
+        privileges still run in fresh containers.
+
+        Note that all commands executed in the session share the container filesystem.
+        """
+        podman_cmd = ["podman", "run", "--detach", "--rm", self._image_name, "sleep", "infinity"]
+        start = time.monotonic()
+        proc = subprocess.run(podman_cmd, stdout=subprocess.PIPE, text=True)
+        recorder.record("start", podman_cmd, [], time.monotonic() - start, proc.returncode)
+        proc.check_returncode()
+        self._session_id = proc.stdout.strip()
+        log.debug("started session container %s", self._session_id)
+        try:
+            yield self
+        finally:
+            subprocess.run(
+                ["podman", "rm", "--force", "--time=0", self._session_id],
+                stdout=subprocess.DEVNULL,
+                check=True,
+            )
+            self._session_id = None
 
     def run_cmd(
         self,
@@ -57,6 +138,99 @@ class Container:
         :param cap_add: A list of capabilities to add with --cap-add.
         :param cap_drop: A list of capabilities to drop with --cap-drop.
         """
+        needs_fresh_container = volumes or devices or user or privileged or cap_add or cap_drop
+        if self._session_id and not needs_fresh_container:
+            kind = "exec"
+            podman_cmd = self._podman_exec_args(workdir)
+        else:
+            kind = "run"
+            podman_cmd = self._podman_run_args(
+                volumes, devices, workdir, user, privileged, cap_add, cap_drop
+            )
+        return self._run_podman(podman_cmd, cmd, kind, check, capture_output)
+
+    def _run_podman(
+        self,
+        podman_cmd: list[str | os.PathLike[str]],
+        cmd: Sequence[str | os.PathLike[str]],
+        kind: str,
+        check: bool,
+        capture_output: bool,
+    ) -> subprocess.CompletedProcess[str]:
+        podman_cmd = [*podman_cmd, *cmd]
+
+        log.debug("%s", shlex.join(map(str, podman_cmd)))
+        start = time.monotonic()
+        proc = subprocess.run(podman_cmd, capture_output=capture_output, text=True)
+        recorder.record(
+            kind,
+            list(map(str, podman_cmd)),
+            list(map(str, cmd)),
+            time.monotonic() - start,
+            proc.returncode,
+        )
+
+        if capture_output:
+            if stdout := proc.stdout.rstrip("\n"):
+                log.debug("stdout>\n%s", stdout)
+            if stderr := proc.stderr.rstrip("\n"):
+                log.error("stderr>\n%s", stderr)
+
+        if check:
+            proc.check_returncode()
+
+        return proc
+
+    def run_cmds_batched(
+        self, cmds: Mapping[str, Sequence[str]]
+    ) -> dict[str, subprocess.CompletedProcess[str]]:
+        """Run all the commands in a single container, return the results by key.
+
+        Requires python3 in the container image. Doesn't raise if any of the commands fail,
+        check the returncode of the results.
+        """
+        batch_cmd = ["python3", "-c", _BATCH_SCRIPT, json.dumps(cmds)]
+        if self._session_id:
+            podman_cmd = self._podman_exec_args(workdir=None)
+        else:
+            podman_cmd = self._podman_run_args((), (), None, None, False, (), ())
+        proc = self._run_podman(podman_cmd, batch_cmd, "batch", check=True, capture_output=True)
+
+        results = json.loads(proc.stdout)
+        for key, result in results.items():
+            cmd = list(cmds[key])
+            recorder.record("batched", cmd, cmd, result["wall_time"], result["returncode"])
+
+        return {
+            key: subprocess.CompletedProcess(
+                args=list(cmds[key]),
+                returncode=result["returncode"],
+                stdout=result["stdout"],
+                stderr=result["stderr"],
+            )
+            for key, result in results.items()
+        }
+
+    def _podman_exec_args(
+        self, workdir: str | os.PathLike[str] | None
+    ) -> list[str | os.PathLike[str]]:
+        assert self._session_id is not None
+        podman_cmd: list[str | os.PathLike[str]] = ["podman", "exec"]
+        if workdir:
+            podman_cmd.append(f"--workdir={workdir}")
+        podman_cmd.append(self._session_id)
+        return podman_cmd
+
+    def _podman_run_args(
+        self,
+        volumes: Sequence[str],
+        devices: Sequence[str],
+        workdir: str | os.PathLike[str] | None,
+        user: str | None,
+        privileged: bool,
+        cap_add: Sequence[str],
+        cap_drop: Sequence[str],
+    ) -> list[str | os.PathLike[str]]:
         podman_cmd: list[str | os.PathLike[str]] = [
             "podman",
             "run",
@@ -88,18 +262,4 @@ class Container:
             podman_cmd.append(f"--cap-drop={cap}")
 
         podman_cmd.append(self._image_name)
-        podman_cmd.extend(cmd)
-
-        log.debug("%s", shlex.join(map(str, podman_cmd)))
-        proc = subprocess.run(podman_cmd, capture_output=capture_output, text=True)
-
-        if capture_output:
-            if stdout := proc.stdout.rstrip("\n"):
-                log.debug("stdout>\n%s", stdout)
-            if stderr := proc.stderr.rstrip("\n"):
-                log.error("stderr>\n%s", stderr)
-
-        if check:
-            proc.check_returncode()
-
-        return proc
+        return podman_cmd
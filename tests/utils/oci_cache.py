@@ -0,0 +1,111 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+
+def default_cache_dir() -> Path:
+    if cache_dir := os.getenv("TEST_CACHE_DIR"):
+        return Path(cache_dir)
+    xdg_cache_home = os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(xdg_cache_home, "task-runner-tests")
+
+
+def cached_oci_layout(image: str, cache_dir: Path, archive: Path | None = None) -> Path:
+    """Get the OCI layout directory for the image from the cache, fetch it if not cached.
+
+    The image must be pinned by digest, the cache is keyed by the digest (so it never
+    needs to be invalidated). If archive is set, seeds the cache from that oci-archive
+    instead of pulling the image from the registry. The archive must contain the pinned
+    image, otherwise this raises ValueError (and doesn't cache anything).
+    """
+    _, _, digest = image.partition("@")
+    if not digest:
+        raise ValueError(f"Only images pinned by digest can be cached: {image}")
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    layout_dir = cache_dir / digest.replace(":", "-")
+    lock_file = cache_dir / f"{layout_dir.name}.lock"
+
+    with lock_file.open("w") as lock:
+        # Other pytest-xdist workers (or sessions) may be fetching the same image
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if layout_dir.exists():
+            log.debug("using cached OCI layout for %s: %s", image, layout_dir)
+            return layout_dir
+
+        if archive:
+            log.info("Seeding the OCI layout cache for %s from %s", image, archive)
+            source = f"oci-archive:{archive}"
+        else:
+            log.info("Fetching %s into the OCI layout cache", image)
+            source = f"docker://{image}"
+
+        with tempfile.TemporaryDirectory(dir=cache_dir, prefix=".tmp-") as tmpdir:
+            subprocess.run(
+                [
+                    "skopeo",
+                    "copy",
+                    # For the Mac users out there (they *can* build from a linux image,
+                    # but we have to explicitly tell skopeo to not try to pull a macos image)
+                    "--override-os=linux",
+                    "--remove-signatures",
+                    source,
+                    f"oci:{tmpdir}/layout",
+                ],
+                check=True,
+            )
+            layout = Path(tmpdir, "layout")
+            # The cache key never expires, never store a different image under it
+            found_digests = _image_digests(source, layout, digest)
+            if digest not in found_digests:
+                raise ValueError(
+                    f"{source} is not {image}, found digests: {', '.join(sorted(found_digests))}"
+                )
+
+            # Rename only after the copy succeeded => the cache never has partial layouts
+            layout.rename(layout_dir)
+
+    return layout_dir
+
+
+def _image_digests(source: str, layout: Path, digest: str) -> set[str]:
+    """Get the digests of the image copied from source to the OCI layout.
+
+    The digests of the manifests in the layout, plus the digest of the top-level manifest
+    in the source. For a multi-arch image, the layout has only the manifest for one
+    platform, the source has the image index.
+    """
+    index = json.loads(layout.joinpath("index.json").read_text())
+    digests = {manifest["digest"] for manifest in index.get("manifests", [])}
+
+    raw_manifest = subprocess.run(
+        ["skopeo", "inspect", "--raw", source], stdout=subprocess.PIPE, check=True
+    ).stdout
+    algorithm, _, _ = digest.partition(":")
+    digests.add(f"{algorithm}:{hashlib.new(algorithm, raw_manifest).hexdigest()}")
+
+    return digests
+
+
+def link_tree(src: Path, dst: Path) -> None:
+    """Recreate the src directory tree at dst, hard-linking the files.
+
+    Falls back to copying when the files can't be hard-linked, e.g. if dst is on
+    a different filesystem.
+    """
+
+    def link_or_copy(src_file: str, dst_file: str) -> None:
+        try:
+            os.link(src_file, dst_file)
+        except OSError:
+            shutil.copy2(src_file, dst_file)
+
+    shutil.copytree(src, dst, copy_function=link_or_copy)
@@ -0,0 +1,99 @@
+"""Timing of the podman calls made by the tests. See timing_plugin.py for the reporting."""
+
+import logging
+import statistics
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from typing import Any
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ContainerCall:
+    # build:   podman build
+    # start:   podman run --detach for a session container
+    # run:     podman run (a fresh container)
+    # exec:    podman exec (in the session container)
+    # batch:   the run or exec of the Container.run_cmds_batched() driver
+    # batched: one of the commands run by Container.run_cmds_batched(), as timed
+    #          inside the container. The argv is the command, not the podman argv.
+    kind: str
+    argv: list[str]
+    # The command executed in the container, empty for build and start
+    cmd: list[str]
+    wall_time: float
+    returncode: int
+    # The nodeid of the test that made the call, if any
+    test: str | None = None
+
+    @property
+    def tool(self) -> str | None:
+        if not self.cmd:
+            return None
+        return self.cmd[0].rpartition("/")[2]
+
+    def asdict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class CallRecorder:
+    calls: list[ContainerCall] = field(default_factory=list)
+    current_test: str | None = None
+
+    def record(
+        self,
+        kind: str,
+        argv: list[str],
+        cmd: list[str],
+        wall_time: float,
+        returncode: int,
+    ) -> None:
+        call = ContainerCall(kind, argv, cmd, wall_time, returncode, self.current_test)
+        log.debug("%s took %.3fs (exit code %d)", kind, wall_time, returncode)
+        self.calls.append(call)
+
+
+recorder = CallRecorder()
+
+
+def timing_report(calls: list[ContainerCall]) -> dict[str, Any]:
+    kinds: defaultdict[str, list[float]] = defaultdict(list)
+    tools: defaultdict[str, list[float]] = defaultdict(list)
+    tests: defaultdict[str, list[float]] = defaultdict(list)
+
+    for call in calls:
+        kinds[call.kind].append(call.wall_time)
+        # The batch driver itself would only duplicate the times of the batched commands
+        if call.tool and call.kind != "batch":
+            tools[call.tool].append(call.wall_time)
+        if call.test and call.kind != "batched":
+            tests[call.test].append(call.wall_time)
+
+    # A detached podman run returns right after starting the container, so the start
+    # calls measure the start overhead. Assume each fresh container costs the same.
+    start_times = kinds.get("start", [])
+    start_overhead = None
+    if start_times:
+        start_overhead = sum(start_times) + len(kinds.get("run", [])) * statistics.median(
+            start_times
+        )
+
+    return {
+        "build_time": sum(kinds.get("build", [])),
+        "estimated_start_overhead": start_overhead,
+        "kinds": {kind: _stats(times) for kind, times in sorted(kinds.items())},
+        "tools": _sorted_stats(tools, "tool"),
+        "tests": _sorted_stats(tests, "test"),
+        "calls": [call.asdict() for call in calls],
+    }
+
+
+def _stats(times: list[float]) -> dict[str, Any]:
+    return {"calls": len(times), "total": sum(times), "max": max(times)}
+
+
+def _sorted_stats(times_by_key: dict[str, list[float]], key_name: str) -> list[dict[str, Any]]:
+    stats = [{key_name: key} | _stats(times) for key, times in times_by_key.items()]
+    return sorted(stats, key=lambda item: item["total"], reverse=True)
@@ -0,0 +1,75 @@
+"""A pytest plugin that reports the timing of the podman calls made by the tests.
+
+At the end of the session, prints a summary (the build time, the container start overhead,
+the slowest tools and tests). With --container-timing-json=PATH, also writes the full
+report as JSON. Works with pytest-xdist, the workers send their calls to the controller.
+"""
+
+import json
+from pathlib import Path
+from typing import Any, Iterator
+
+import pytest
+
+from tests.utils.timing import ContainerCall, recorder, timing_report
+
+# How many of the slowest tools and tests to print
+_TOP_N = 10
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    parser.addoption(
+        "--container-timing-json",
+        metavar="PATH",
+        type=Path,
+        help="Write the timing report of the podman calls made by the tests to PATH.",
+    )
+
+
+@pytest.hookimpl(wrapper=True)
+def pytest_runtest_protocol(item: pytest.Item) -> Iterator[None]:
+    recorder.current_test = item.nodeid
+    try:
+        return (yield)
+    finally:
+        recorder.current_test = None
+
+
+def pytest_sessionfinish(session: pytest.Session) -> None:
+    # On pytest-xdist workers, send the calls to the controller
+    if (workeroutput := getattr(session.config, "workeroutput", None)) is not None:
+        workeroutput["container_calls"] = [call.asdict() for call in recorder.calls]
+        return
+
+    if outfile := session.config.getoption("container_timing_json"):
+        outfile.write_text(json.dumps(timing_report(recorder.calls), indent=2) + "\n")
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node: Any, error: Any) -> None:
+    for call in getattr(node, "workeroutput", {}).get("container_calls", []):
+        recorder.calls.append(ContainerCall(**call))
+
+
+def pytest_terminal_summary(terminalreporter: pytest.TerminalReporter) -> None:
+    if not recorder.calls:
+        return
+
+    report = timing_report(recorder.calls)
+    write_line = terminalreporter.write_line
+    terminalreporter.section("container timing")
+
+    write_line(f"build time: {report['build_time']:.2f}s")
+    if (start_overhead := report["estimated_start_overhead"]) is not None:
+        write_line(f"container start overhead (estimated): {start_overhead:.2f}s")
+    for kind, stats in report["kinds"].items():
+        write_line(f"{kind}: {stats['calls']} calls, {stats['total']:.2f}s total")
+
+    for key_name in ("tool", "test"):
+        write_line("")
+        write_line(f"slowest {key_name}s:")
+        for stats in report[f"{key_name}s"][:_TOP_N]:
+            write_line(
+                f"  {stats['total']:8.2f}s total  {stats['max']:7.2f}s max  "
+                f"{stats['calls']:4d} calls  {stats[key_name]}"
+            )